@@ -1,3 +1,127 @@
-from bdsolve.ui import LearnUI, PlayUI
+import os, argparse
 
-LearnUI()
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='bdsolve',
+        description='An optimizing solver for the game of sudoku-with-blocks')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('learn', help='learning GUI (default)')
+    p = sub.add_parser('train', help='headless training')
+    p.add_argument(
+        '-g', '--generations', type=int, default=100,
+        help='number of generations (default: %(default)s)')
+    p.add_argument(
+        '-p', '--population', type=int, default=100,
+        help='population size (default: %(default)s)')
+    p.add_argument(
+        '-s', '--seed', type=int, default=None,
+        help='seed of the game RNGs')
+    p.add_argument(
+        '-w', '--workers', type=int, default=None,
+        help='number of worker processes (default: CPU count)')
+    p.add_argument(
+        '-i', '--interval', type=int, default=1,
+        help='report progress every N generations, 0 to disable (default: %(default)s)')
+    p.add_argument(
+        '--planner', choices=['greedy', 'beam', 'ucb'], default='greedy',
+        help='planner choosing the moves of each round (default: %(default)s)')
+    p.add_argument(
+        '--budget', type=float, default=None, metavar='SECONDS',
+        help='time budget per round of the beam and ucb planners')
+    p.add_argument(
+        '--hidden', type=int, nargs='+', default=[], metavar='N',
+        help='sizes of the hidden layers of the network (default: linear)')
+    p.add_argument(
+        '--cells', action='store_true',
+        help='use the board cells as network inputs')
+    p.add_argument(
+        '--size', type=int, default=9, metavar='S',
+        help='board size (default: %(default)s)')
+    p.add_argument(
+        '--block-size', type=int, default=3, metavar='BS',
+        help='block size, dividing the board size (default: %(default)s)')
+    p.add_argument(
+        '-k', '--sequences', type=int, default=0, metavar='K',
+        help='play every genome on the same K piece sequences per generation')
+    p.add_argument(
+        '-m', '--metrics', default=None, metavar='PATH',
+        help='append per-generation metrics to PATH (.csv, else JSON lines)')
+    p.add_argument(
+        '--replay', default=None, metavar='PATH',
+        help='append every move played to the replay log at PATH')
+    p.add_argument(
+        '--profile', default=None, metavar='PATH',
+        help='profile the rounds played, writing the stats to PATH')
+    p.add_argument(
+        '-c', '--checkpoint', default=None, metavar='PATH',
+        help='save the training state to PATH (.npz)')
+    p.add_argument(
+        '--checkpoint-interval', type=int, default=1, metavar='N',
+        help='save a checkpoint every N generations (default: %(default)s)')
+    p.add_argument(
+        '-r', '--resume', action='store_true',
+        help='resume from the checkpoint, if it exists')
+    p = sub.add_parser('bench', help='benchmark the hot paths')
+    p.add_argument(
+        '-n', '--number', type=int, default=1000,
+        help='corpus size, operations per benchmark (default: %(default)s)')
+    p.add_argument(
+        '-s', '--seed', type=int, default=0,
+        help='seed of the corpus (default: %(default)s)')
+    p.add_argument(
+        '--only', nargs='+', metavar='NAME',
+        help='run only the named benchmarks')
+    p.add_argument(
+        '--json', action='store_true',
+        help='print the report as JSON')
+    p.add_argument(
+        '-o', '--output', default=None, metavar='PATH',
+        help='write the report as JSON to PATH')
+    args = parser.parse_args(argv)
+
+    if args.command == 'train':
+        from bdsolve.metrics import metrics, open_sink
+        from bdsolve.solver.network import Network
+        from bdsolve.solver.planners import planners
+        from bdsolve.solver.train import Trainer
+        if args.resume and not args.checkpoint:
+            parser.error('--resume requires --checkpoint')
+        if args.block_size < 1 or args.size % args.block_size:
+            parser.error('--size must be a multiple of --block-size')
+        planner = None
+        if args.planner != 'greedy':
+            planner = planners[args.planner](budget=args.budget)
+        network = Network(args.hidden, args.cells)
+        if args.metrics:
+            metrics.sink = open_sink(args.metrics)
+        if args.profile:
+            os.environ['BDSOLVE_PROFILE'] = '1'
+            metrics.enable_profile()
+        if args.resume and os.path.exists(args.checkpoint):
+            t = Trainer.load(
+                args.checkpoint, args.workers, planner=planner,
+                network=network, sequences=args.sequences,
+                s=args.size, bs=args.block_size, replay=args.replay)
+        else:
+            t = Trainer(
+                args.population, args.workers, args.seed,
+                planner, network, args.sequences,
+                args.size, args.block_size, args.replay)
+        with t:
+            t.run(
+                args.generations, args.interval,
+                checkpoint=args.checkpoint,
+                checkpoint_interval=args.checkpoint_interval)
+        if args.profile:
+            metrics.dump_profile(args.profile)
+        if args.metrics:
+            metrics.sink.close()
+    elif args.command == 'bench':
+        from bdsolve import bench
+        bench.main(args)
+    else:
+        from bdsolve.ui import LearnUI
+        LearnUI()
+
+if __name__ == '__main__':
+    main()
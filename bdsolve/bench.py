@@ -0,0 +1,180 @@
+'''
+Benchmarks of the move generation and evaluation hot paths.
+
+Every benchmark times single operations on a corpus of board
+states and pieces drawn from a fixed seed, reporting operations
+per second, latency percentiles (in microseconds) and the peak
+memory allocated by one pass over the corpus.
+'''
+
+import sys, json, time, platform, tracemalloc
+import numpy as np
+from bdsolve.game.board import Board
+from bdsolve.game.features import STATS
+from bdsolve.game.moves import legal_moves
+from bdsolve.game.pieces import all_pieces
+from bdsolve.game.utils import runs1d, runs2d
+from bdsolve.solver.genetic import GA, Player
+from bdsolve.solver.train import Trainer
+
+def corpus(n, seed=0):
+    '''
+    'n' pairs of (board, piece) from random games,
+    the piece fitting somewhere on the board.
+    '''
+    rng = np.random.default_rng(seed)
+    b = Board()
+    res = []
+    while len(res) < n:
+        piece = all_pieces[rng.integers(len(all_pieces))]
+        moves = legal_moves(b, piece)
+        if not moves:
+            b.reset()
+            continue
+        res.append((b.copy(), piece))
+        b.place(piece, moves[rng.integers(len(moves))])
+        b.reduce_subsets()
+        b.commit()
+    return res
+
+def measure(make):
+    '''
+    Time every operation (a callable without arguments) built by
+    'make' once, then run a fresh set of operations, built after
+    timing so they start from the same state (see 'benchmarks'),
+    to find the peak allocated memory.
+    '''
+    ops = make()
+    samples = np.empty(len(ops))
+    for i, op in enumerate(ops):
+        t = time.perf_counter()
+        op()
+        samples[i] = time.perf_counter() - t
+    ops = make()
+    tracemalloc.start()
+    for op in ops:
+        op()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    p50, p90, p99 = np.percentile(samples, [50, 90, 99]) * 1e6
+    return {
+        'n': len(ops),
+        'ops_per_sec': round(len(ops) / samples.sum(), 1),
+        'mean_us': round(samples.mean() * 1e6, 2),
+        'p50_us': round(p50, 2),
+        'p90_us': round(p90, 2),
+        'p99_us': round(p99, 2),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+def benchmarks(n=1000, seed=0):
+    '''
+    Operations of all benchmarks, by name.
+    Each call builds fresh operations on the same corpus.
+    '''
+    data = corpus(n, seed)
+    rng = np.random.default_rng(seed)
+    moves = []
+    for b, p in data:
+        pos = legal_moves(b, p)
+        moves.append((b, p, pos[rng.integers(len(pos))]))
+    genome = GA(1, seed).population[0]
+
+    def place():
+        ops = []
+        for b, p, pos in moves:
+            b = b.copy()
+            ops.append(lambda b=b, p=p, pos=pos: b.place(p, pos))
+        return ops
+
+    def reduce_subsets():
+        ops = []
+        for b, p, pos in moves:
+            b = b.copy()
+            b.place(p, pos)
+            ops.append(b.reduce_subsets)
+        return ops
+
+    def stat(name):
+        return lambda: [
+            lambda b=b: getattr(b, name) for b, _ in data]
+
+    def play():
+        p = Player(genome, np.random.default_rng(seed))
+        def op():
+            if not p.play():
+                p.board.reset()
+        return [op] * max(1, n // 10)
+
+    def generation():
+        t = Trainer(pop_count=max(2, n // 50), workers=1, seed=seed)
+        return [t.step] * 2
+
+    p = Player(genome)
+    bench = {
+        'place': place,
+        'reduce_subsets': reduce_subsets,
+        'runs1d': lambda: [
+            lambda r=b.row(i % b.s).copy(): runs1d(r)
+            for i, (b, _) in enumerate(data)],
+        'runs2d': lambda: [
+            lambda a=b.block(i % b.s).copy(): runs2d(a)
+            for i, (b, _) in enumerate(data)],
+        'runs2d_diagonal': lambda: [
+            lambda a=b.board.copy(): runs2d(a, diagonal=True)
+            for b, _ in data],
+    }
+    for name in STATS:
+        bench[name] = stat(name)
+    bench['evaluate'] = lambda: [
+        lambda b=b, pc=pc, pos=pos: p.evaluate(pc, pos, b)
+        for b, pc, pos in moves]
+    bench['move_values'] = lambda: [
+        lambda b=b, pc=pc: p.move_values([(b.bits, pc)], b.s, b.bs)
+        for b, pc in data]
+    bench['play'] = play
+    bench['generation'] = generation
+    return bench
+
+def run(n=1000, seed=0, only=None):
+    '''
+    Run the benchmarks (all, or those named in 'only').
+    Returns a JSON-serializable report.
+    '''
+    bench = benchmarks(n, seed)
+    results = {}
+    for name, ops in bench.items():
+        if only and name not in only:
+            continue
+        results[name] = measure(ops)
+    return {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'n': n,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+def report(res, out=sys.stdout):
+    '''
+    Print a report as a table.
+    '''
+    cols = ['ops_per_sec', 'p50_us', 'p90_us', 'p99_us', 'peak_kib']
+    print(f'{"":18}' + ''.join(f'{c:>13}' for c in cols), file=out)
+    for name, r in res['results'].items():
+        print(f'{name:18}' + ''.join(f'{r[c]:>13}' for c in cols), file=out)
+
+def main(args):
+    res = run(args.number, args.seed, args.only)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(res, f, indent=2)
+    if args.json:
+        json.dump(res, sys.stdout, indent=2)
+        print()
+    else:
+        report(res)
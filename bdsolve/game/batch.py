@@ -0,0 +1,149 @@
+import numpy as np
+from functools import lru_cache
+from bdsolve.game.bitboard import subset_masks, pack_many, unpack_many
+from bdsolve.game.moves import move_table
+from bdsolve.game.pieces import catalog
+
+@lru_cache(maxsize=None)
+def subset_matrix(s, bs):
+    '''
+    Elements of all subsets (rows, then columns, then blocks)
+    of a board of size 's' with block size 'bs',
+    as a float32 array of shape (subsets, s*s).
+    '''
+    masks = [m for ms in subset_masks(s, bs) for m in ms]
+    return unpack_many(masks, s).reshape(len(masks), s*s).astype(np.float32)
+
+class BoardBatch:
+    '''
+    'm' games on boards of size 's' with block size 'bs',
+    stepped in lockstep with array operations.
+
+    'cells' holds the boards as an (m, s*s) boolean array,
+    'alive' marks games not yet over and 'score' their scores.
+    'step_score' and 'step_cleared' hold the score and the count
+    of cleared subsets of every move of the last round, shape (m, moves).
+    Finished games are left untouched by all operations.
+    '''
+
+    def __init__(self, m, s=9, bs=3):
+        self.s = s
+        self.bs = bs
+        self.table = move_table(s, bs)
+        self.subsets = subset_matrix(s, bs)
+        self.sizes = self.subsets.sum(1)
+        self.cells = np.zeros((m, s*s), dtype=bool)
+        self.alive = np.ones(m, dtype=bool)
+        self.score = np.zeros(m, dtype=np.int64)
+        self.cleared = np.zeros(m, dtype=np.int64)
+        self.step_score = np.zeros((m, 0), dtype=np.int64)
+        self.step_cleared = np.zeros((m, 0), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.cells)
+
+    @classmethod
+    def from_bits(cls, bits_ls, s=9, bs=3):
+        '''
+        A batch of games starting from the given bitboards.
+        '''
+        b = cls(len(bits_ls), s, bs)
+        b.cells[:] = unpack_many(bits_ls, s).reshape(len(bits_ls), s*s)
+        return b
+
+    def bits(self):
+        '''
+        Bitboards of all games.
+        '''
+        return pack_many(self.cells)
+
+    def boards(self):
+        '''
+        All boards as an int8 array of shape (m, s, s).
+        '''
+        return self.cells.view(np.int8).reshape(-1, self.s, self.s)
+
+    def legal(self, piece):
+        '''
+        Legal placements of a piece (array or ID) in every game,
+        as a boolean array of shape (m, placements) (see 'MoveTable.moves').
+        '''
+        overlap = self.cells.astype(np.float32) @ \
+            self.table.cells(piece).T.astype(np.float32)
+        return (overlap == 0) & self.alive[:, None]
+
+    def end_dead(self, games, ids):
+        '''
+        End the given games in which the pieces of their round
+        ('ids', piece IDs of shape (len(games), pieces), see 'catalog')
+        can not all be placed, by the check of 'moves.is_dead':
+        a piece fits nowhere and no subset can be completed with
+        any placements of the pieces. Every distinct piece is checked
+        in all games at once (see 'legal').
+        Returns a boolean array marking the games still alive.
+        '''
+        ids = np.asarray(ids)
+        stuck = np.zeros(len(games), dtype=bool)
+        free = np.zeros((len(games), self.s**2), dtype=bool)
+        for k in np.unique(ids):
+            has = (ids == k).any(1)
+            cells = self.table.cells(k).astype(np.float32)
+            legal = self.legal(k)[games]
+            stuck |= has & ~legal.any(1)
+            free |= has[:, None] & ((legal.astype(np.float32) @ cells) > 0)
+        full = ((self.cells[games] | free).astype(np.float32)
+            @ self.subsets.T) == self.sizes
+        over = stuck & ~full.any(1)
+        self.alive[games[over]] = False
+        return ~over
+
+    def reduce(self):
+        '''
+        Empty occupied subsets of all live games (see 'Board.reduce_subsets'),
+        setting 'cleared' to their counts.
+        Returns the scores.
+        '''
+        full = (self.cells.astype(np.float32) @ self.subsets.T) == self.sizes
+        full &= self.alive[:, None]
+        self.cleared = full.sum(1)
+        clear = (full.astype(np.float32) @ self.subsets) > 0
+        self.cells &= ~clear
+        return full @ (2*self.sizes).astype(np.int64)
+
+    def apply(self, games, plans):
+        '''
+        Play a round in the given games, each with its plan
+        (list of (piece, position), or None if the game is over,
+        see 'Player.plan'). Pieces are placed one step at a time
+        in all games, followed by reducing subsets; the placements
+        of a step are gathered from the move table per piece ID.
+        Returns the scores of the round (of all games).
+        '''
+        s = self.s
+        score = np.zeros(len(self), dtype=np.int64)
+        for g, moves in zip(games, plans):
+            if moves is None:
+                self.alive[g] = False
+        steps = max((len(m) for m in plans if m), default=0)
+        self.step_score = np.zeros((len(self), steps), dtype=np.int64)
+        self.step_cleared = np.zeros((len(self), steps), dtype=np.int64)
+        for t in range(steps):
+            step = [
+                (g, *moves[t]) for g, moves in zip(games, plans)
+                if moves and t < len(moves)
+            ]
+            rows = np.array([g for g, _, _ in step])
+            ids = np.array([catalog.id(piece) for _, piece, _ in step])
+            pos = np.array([p for _, _, p in step]).reshape(-1, 2)
+            idx = pos[:, 0]*(s - catalog.bbox[ids, 1].astype(int) + 1) + pos[:, 1]
+            add = np.zeros_like(self.cells)
+            for k in np.unique(ids):
+                sel = ids == k
+                add[rows[sel]] = self.table.cells(k)[idx[sel]]
+            self.cells |= add
+            self.step_score[rows, t] = catalog.sizes[ids]
+            self.step_score[:, t] += self.reduce()
+            self.step_cleared[:, t] = self.cleared
+            score += self.step_score[:, t]
+        self.score += score
+        return score
@@ -0,0 +1,172 @@
+import numpy as np
+from functools import lru_cache
+from bdsolve.game.utils import ndarray_key
+
+_position_masks = {}
+
+@lru_cache(maxsize=None)
+def subset_masks(s, bs):
+    '''
+    Bitmasks of all rows, columns and blocks
+    of a board of size 's' with block size 'bs'.
+    Element (i, j) of the board is bit (i*s + j).
+    '''
+    bw = s//bs
+    row = (1 << s) - 1
+    col = sum(1 << (i*s) for i in range(s))
+    blk = sum(1 << (i*s + j) for i in range(bs) for j in range(bs))
+    return (
+        tuple(row << (i*s) for i in range(s)),
+        tuple(col << i for i in range(s)),
+        tuple(
+            blk << (y*bs*s + x*bs)
+            for y, x in (divmod(i, bw) for i in range(bw**2))
+        )
+    )
+
+@lru_cache(maxsize=2**14)
+def relayout(m, s, bs):
+    '''
+    A bitmask in column-major order (element (i, j) being
+    bit (j*s + i)) and in block-major order (element l of block k,
+    both row-major, being bit (k*bs*bs + l)), followed by the
+    indices of the subsets it touches (as in 'subset_masks').
+    '''
+    bw = s//bs
+    cm, km, touched = 0, 0, set()
+    while m:
+        low = m & -m
+        m ^= low
+        i, j = divmod(low.bit_length()-1, s)
+        k = (i//bs)*bw + j//bs
+        cm |= 1 << (j*s + i)
+        km |= 1 << (k*bs*bs + (i%bs)*bs + j%bs)
+        touched.update((i, s+j, 2*s+k))
+    return cm, km, tuple(sorted(touched))
+
+def piece_mask(piece, s):
+    '''
+    Bitmask of a piece at position (0, 0).
+    '''
+    m = 0
+    for i, j in zip(*np.nonzero(piece)):
+        m |= 1 << (int(i)*s + int(j))
+    return m
+
+def position_masks(piece, s):
+    '''
+    Bitmasks of a piece at every position (y, x) it fits
+    on a board of size 's', indexed as [y][x].
+    Computed once per piece and board size.
+    '''
+    key = (s, ndarray_key(piece))
+    masks = _position_masks.get(key)
+    if masks is None:
+        y, x = piece.shape
+        m = piece_mask(piece, s)
+        masks = _position_masks[key] = [
+            [m << (i*s + j) for j in range(1+s-x)]
+            for i in range(1+s-y)
+        ]
+    return masks
+
+def pack(arr):
+    '''
+    Bitboard of the nonzero elements of a square matrix.
+    '''
+    return int.from_bytes(np.packbits(
+        np.not_equal(arr, 0).ravel(), bitorder='little'
+    ).tobytes(), 'little')
+
+def unpack(bits, s):
+    '''
+    Square int8 matrix of size 's' from a bitboard.
+    '''
+    n = s*s
+    return np.unpackbits(
+        np.frombuffer(bits.to_bytes((n+7)//8, 'little'), dtype=np.uint8),
+        count=n, bitorder='little'
+    ).view(np.int8).reshape(s, s)
+
+def pack_many(arr):
+    '''
+    Bitboards of the nonzero elements of a stack
+    of square matrices, shape (N, s, s).
+    '''
+    data = np.packbits(
+        np.not_equal(arr, 0).reshape(len(arr), -1), axis=1, bitorder='little')
+    return [int.from_bytes(row.tobytes(), 'little') for row in data]
+
+def unpack_many(bits_ls, s):
+    '''
+    Stack of square int8 matrices of size 's'
+    from a sequence of bitboards, shape (N, s, s).
+    '''
+    n = s*s
+    nb = (n+7)//8
+    data = b''.join(bits.to_bytes(nb, 'little') for bits in bits_ls)
+    return np.unpackbits(
+        np.frombuffer(data, dtype=np.uint8).reshape(-1, nb),
+        axis=1, count=n, bitorder='little'
+    ).view(np.int8).reshape(-1, s, s)
+
+@lru_cache(maxsize=None)
+def edge_masks(s):
+    '''
+    Masks of all elements of a board of size 's', of those
+    not in the first column and of those not in the last column.
+    '''
+    full = (1 << s*s) - 1
+    col = sum(1 << (i*s) for i in range(s))
+    return full, full & ~col, full & ~(col << (s-1))
+
+def region_sizes_bits(bits, s):
+    '''
+    Sizes of the connected regions of empty elements
+    (sharing an edge or a vertex) of a bitboard, by flood filling
+    each region with masked shifts.
+    '''
+    full, not_first, not_last = edge_masks(s)
+    free = full & ~bits
+    sizes = []
+    while free:
+        r = free & -free
+        while True:
+            h = r | ((r << 1) & not_first) | ((r >> 1) & not_last)
+            n = (h | (h << s) | (h >> s)) & free
+            if n == r:
+                break
+            r = n
+        free &= ~r
+        sizes.append(r.bit_count())
+    return sizes
+
+def reduce_bits(bits, s, bs):
+    '''
+    Empty occupied subsets of a bitboard, as 'Board.reduce_subsets'.
+    Returns the new bitboard and the score.
+    '''
+    count, clear = 0, 0
+    rows, cols, blocks = subset_masks(s, bs)
+    for m in rows + cols:
+        if bits & m == m:
+            clear |= m
+            count += s*2
+    for m in blocks:
+        if bits & m == m:
+            clear |= m
+            count += (bs**2)*2
+    return bits & ~clear, count
+
+def play_bits(bits, moves, s, bs):
+    '''
+    Place pieces (a list of (piece, position)) onto a bitboard,
+    reducing occupied subsets after each, as 'Player.play'.
+    Returns the new bitboard and the score.
+    '''
+    score = 0
+    for piece, (i, j) in moves:
+        m = position_masks(piece, s)[i][j]
+        bits, count = reduce_bits(bits | m, s, bs)
+        score += m.bit_count() + count
+    return bits, score
@@ -1,5 +1,8 @@
 import numpy as np
-from bdsolve.game.utils import runs1d, runs2d
+from bdsolve.game.bitboard import position_masks, relayout, pack, unpack
+from bdsolve.game import features
+from bdsolve.game.features import STATS
+from bdsolve.game.geometry import geometry
 
 class Board:
     '''
@@ -11,39 +14,150 @@ class Board:
     by a piece, though placing a piece over another is allowed.
     Completely occupied subsets can be reduced (emptied), giving a score.
 
-    TODO: globally cache pairs of (board state, statistical property)
-          to reduce unnecessary computation of the same values.
+    The state is kept as an occupancy bitboard ('bits'),
+    element (i, j) being bit (i*s + j), and as its column-major
+    and block-major reorderings, so the occupation pattern of any
+    subset is a single shift. The matrix ('board') and its subsets
+    are views of it, updated on access.
+
+    Per-subset statistics ('vals') and occupied element counts
+    ('fill') are updated for the touched subsets only.
+    Every 'place' and 'reduce_subsets' can be reverted with 'undo',
+    until 'commit' or 'reset'.
+    Tables of the geometry are shared by all boards (see 'geometry').
     '''
 
     def __init__(self, s=9, bs=3):
-        self.s = s
-        self.bs = bs
-        self.bw = s//bs
-        self.board = np.zeros(shape=(s, s), dtype=np.int8)
+        self.geo = geo = geometry(s, bs)
+        self.s, self.bs, self.bw = geo.s, geo.bs, geo.bw
+        self.masks, self.sizes, self.tables = geo.masks, geo.sizes, geo.tables
+        self.history = []
+        self._board = None
+        self._board_bits = 0
+        self.bits = 0
+
+    @property
+    def bits(self):
+        '''
+        The occupancy bitboard.
+        '''
+        return self._bits
+
+    @bits.setter
+    def bits(self, bits):
+        self._bits = bits
+        self._cbits, self._kbits, _ = relayout(bits, self.s, self.bs)
+        self.vals = [0.0]*len(self.sizes)
+        self.fill = [0]*len(self.sizes)
+        self.history.clear()
+        self._eval(range(len(self.sizes)))
+
+    @property
+    def board(self):
+        '''
+        The board state as a read-only int8 matrix (assign
+        to 'board' or 'bits' to change it).
+        Always the same object, synced with the bitboard.
+        '''
+        if self._board is None:
+            self._board = np.zeros(shape=(self.s, self.s), dtype=np.int8)
+            self._board.setflags(write=False)
+            self._board_bits = 0
+        if self._board_bits != self._bits:
+            self._board.setflags(write=True)
+            self._board[:] = unpack(self._bits, self.s)
+            self._board.setflags(write=False)
+            self._board_bits = self._bits
+        return self._board
+
+    @board.setter
+    def board(self, arr):
+        self.bits = pack(arr)
+
+    def _eval(self, subsets):
+        '''
+        Update statistics of the given subsets from the bitboards.
+        '''
+        s, n = self.s, self.bs**2
+        rt, bt = self.tables
+        line, blk = (1 << s) - 1, (1 << n) - 1
+        for k in subsets:
+            if k < s:
+                p = (self._bits >> (k*s)) & line
+                self.vals[k] = rt[p]
+            elif k < 2*s:
+                p = (self._cbits >> ((k-s)*s)) & line
+                self.vals[k] = rt[p]
+            else:
+                p = (self._kbits >> ((k-2*s)*n)) & blk
+                self.vals[k] = bt[p]
+            self.fill[k] = p.bit_count()
+
+    def _update(self, bits, cbits, kbits, subsets):
+        '''
+        Set a new state touching the given subsets, saving the old one.
+        '''
+        self.history.append((
+            self._bits, self._cbits, self._kbits,
+            [(k, self.vals[k], self.fill[k]) for k in subsets]
+        ))
+        self._bits, self._cbits, self._kbits = bits, cbits, kbits
+        self._eval(subsets)
+
+    def undo(self):
+        '''
+        Revert the last 'place' or 'reduce_subsets'.
+        '''
+        self._bits, self._cbits, self._kbits, old = self.history.pop()
+        for k, val, fill in old:
+            self.vals[k] = val
+            self.fill[k] = fill
+
+    def commit(self):
+        '''
+        Forget the undo history.
+        '''
+        self.history.clear()
 
     def reset(self):
         '''
         Set all elements to zero.
         '''
-        self.board *= 0
+        self.bits = 0
 
     def copy(self):
         '''
         Return a new board object with identical state.
         '''
-        b = Board(self.s, self.bs)
-        b.board = self.board.copy()
+        b = Board.__new__(Board)
+        b.geo, b.s, b.bs, b.bw = self.geo, self.s, self.bs, self.bw
+        b.masks, b.sizes, b.tables = self.masks, self.sizes, self.tables
+        b.vals, b.fill = self.vals.copy(), self.fill.copy()
+        b.history = []
+        b._board = None
+        b._board_bits = 0
+        b._bits, b._cbits, b._kbits = self._bits, self._cbits, self._kbits
         return b
 
+    def fits(self, piece, pos):
+        '''
+        Check if a piece can be placed at position (y, x)
+        without overlapping occupied elements.
+        '''
+        i, j = pos
+        return not self._bits & position_masks(piece, self.s)[i][j]
+
     def place(self, piece, pos):
         '''
         Place a piece onto the board at position (y, x).
         Returns count of piece elements placed (score).
         '''
-        y, x = piece.shape
         i, j = pos
-        self.board[i:i+y, j:j+x] += piece
-        return np.count_nonzero(piece)
+        m = position_masks(piece, self.s)[i][j]
+        cm, km, subsets = relayout(m, self.s, self.bs)
+        self._update(
+            self._bits | m, self._cbits | cm, self._kbits | km, subsets)
+        return m.bit_count()
 
     def reduce_subsets(self):
         '''
@@ -51,40 +165,32 @@ class Board:
         Returns count of zeroed elements * 2 per subset (score).
         Overlapping subsets are scored independently.
         '''
-        count = 0
-        for i in range(self.s):
-            r = self.row(i).copy()
-            c = self.col(i).copy()
-            b = self.block(i).copy()
-            if r.all():
-                br = self.row(i)
-                br *= 0
-                count += self.s*2
-            if c.all():
-                bc = self.col(i)
-                bc *= 0
-                count += self.s*2
-            if b.all():
-                bb = self.block(i)
-                bb *= 0
-                count += (self.bs**2)*2
+        count, clear = 0, 0
+        masks = self.masks[0] + self.masks[1] + self.masks[2]
+        for k, (fill, size) in enumerate(zip(self.fill, self.sizes)):
+            if fill == size:
+                clear |= masks[k]
+                count += size*2
+        cm, km, subsets = relayout(clear, self.s, self.bs)
+        self._update(
+            self._bits & ~clear, self._cbits & ~cm, self._kbits & ~km, subsets)
         return count
 
     def row(self, i):
         '''
-        The i-th row. (reference, not a copy)
+        The i-th row. (read-only view)
         '''
         return self.board[i, :]
 
     def col(self, i):
         '''
-        The i-th column. (reference, not a copy)
+        The i-th column. (read-only view)
         '''
         return self.board[:, i]
 
     def block(self, i):
         '''
-        The i-th block. (reference, not a copy)
+        The i-th block. (read-only view)
         '''
         bs, bw = self.bs, self.bw
         y, x = divmod(i, bw)
@@ -95,19 +201,21 @@ class Board:
         '''
         Ratio of all occupied elements and board area.
         '''
-        return np.round(np.count_nonzero(self.board) / (self.s**2), 2)
+        return np.round(self._bits.bit_count() / (self.s**2), 2)
+
+    @property
+    def full_subsets(self):
+        '''
+        Count of completely occupied subsets.
+        '''
+        return sum(f == n for f, n in zip(self.fill, self.sizes))
 
     @property
     def subset_occupation(self):
         '''
         Ratio of occupied subsets and num. of subsets.
         '''
-        res = 0
-        for i in range(self.s):
-            res += self.row(i).all()
-            res += self.col(i).all()
-            res += self.block(i).all()
-        return np.round(res / (3 * self.s), 2)
+        return np.round(self.full_subsets / (3 * self.s), 2)
 
     @property
     def row_integrity(self):
@@ -116,13 +224,7 @@ class Board:
         taking into account the sizes of free regions.
         '''
         s = self.s
-        val = 0
-        res = np.zeros(s+1)
-        for i in range(s):
-            res[runs1d(self.row(i))] += 1
-        for i in range(1, res.size):
-            val += (s+1-i) * res[i]
-        return np.round(val / (45 * s), 2)
+        return np.round(sum(self.vals[:s]) / (self.geo.norm * s), 2)
 
     @property
     def col_integrity(self):
@@ -131,13 +233,7 @@ class Board:
         taking into account the sizes of free regions.
         '''
         s = self.s
-        val = 0
-        res = np.zeros(s+1)
-        for i in range(s):
-            res[runs1d(self.col(i))] += 1
-        for i in range(1, res.size):
-            val += (s+1-i) * res[i]
-        return np.round(val / (45 * s), 2)
+        return np.round(sum(self.vals[s:2*s]) / (self.geo.norm * s), 2)
 
     @property
     def block_integrity(self):
@@ -146,13 +242,7 @@ class Board:
         taking into account the sizes of free regions.
         '''
         s = self.s
-        val = 0
-        res = np.zeros(s+1)
-        for i in range(s):
-            res[runs2d(self.block(i))] += 1
-        for i in range(1, res.size):
-            val += (s+1-i) * res[i]
-        return np.round(val / (45 * s), 2)
+        return np.round(sum(self.vals[2*s:]) / self.geo.block_norm, 2)
 
     @property
     def integrity(self):
@@ -162,10 +252,10 @@ class Board:
         Similar to 'block_integrity' but considers boundaries
         between blocks and diagonally separated regions.
         '''
-        s = self.s
-        val = 0
-        res = np.zeros(s**2+1)
-        res[runs2d(self.board, diagonal=True)] += 1
-        for i in range(1, res.size):
-            val += ((s**2+1)-i) * res[i]
-        return np.round(val / (45 * (s**2)), 2)
+        return features.integrity_bits([self._bits], self.s)[0]
+
+    def stats(self):
+        '''
+        All statistics of the board, ordered as in 'features.STATS'.
+        '''
+        return np.array([getattr(self, k) for k in STATS])
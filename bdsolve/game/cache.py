@@ -0,0 +1,69 @@
+import numpy as np
+from collections import OrderedDict
+
+class LRUCache:
+    '''
+    A bounded mapping, evicting the least recently used
+    entries once 'maxsize' entries are stored.
+    Counts hits, misses and evictions.
+    '''
+
+    def __init__(self, maxsize=2**16):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, default=None):
+        '''
+        The value stored for 'key' or 'default', counting a hit or miss.
+        '''
+        val = self.data.get(key)
+        if val is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.data.move_to_end(key)
+        return val
+
+    def put(self, key, val):
+        '''
+        Store a value, evicting the least recently used entry if full.
+        '''
+        self.data[key] = val
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        '''
+        Remove all entries and reset the counters.
+        '''
+        self.data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        '''
+        Ratio of hits and lookups.
+        '''
+        n = self.hits + self.misses
+        return np.round(self.hits / n, 2) if n else 0.0
+
+    def stats(self):
+        '''
+        Current size and counters as a dict.
+        '''
+        return {
+            'size': len(self.data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': float(self.hit_rate),
+        }
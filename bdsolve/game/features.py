@@ -0,0 +1,163 @@
+'''
+Board statistics computed over a stack of boards at once.
+
+Each function takes an array of shape (N, s, s) and returns
+the values of the equally named 'Board' property for all N boards.
+Per-subset values are looked up in tables indexed by the
+occupation pattern of the subset, built once per geometry
+(see 'geometry').
+
+'cached_stats' computes all statistics for a sequence of bitboards,
+reusing values of previously seen board states from a global cache.
+
+Genome inputs are registered in 'FEATURES' (see 'register'),
+which sets the length of the genomes.
+'''
+
+import numpy as np
+from bdsolve.game.bitboard import pack_many, unpack_many, region_sizes_bits
+from bdsolve.game.cache import LRUCache
+from bdsolve.game.pieces import get_occupation
+from bdsolve.game.geometry import (
+    runs_table, regions_table, line_norm, block_norm)
+from bdsolve.metrics import metrics
+
+STATS = (
+    'col_integrity', 'row_integrity', 'block_integrity',
+    'occupation', 'subset_occupation', 'integrity'
+)
+
+stats_cache = LRUCache(2**16)
+
+def _codes(arr):
+    '''
+    Occupation patterns of the last axis as integers.
+    '''
+    n = arr.shape[-1]
+    return np.not_equal(arr, 0).astype(np.intp) @ (1 << np.arange(n))
+
+def _blocks(arr, bs):
+    '''
+    Blocks of a stack of boards, flattened, shape (N, bw**2, bs**2).
+    '''
+    n, s, _ = arr.shape
+    bw = s//bs
+    return (arr.reshape(n, bw, bs, bw, bs)
+        .transpose(0, 1, 3, 2, 4)
+        .reshape(n, bw*bw, bs*bs))
+
+def occupation(arr):
+    '''
+    Ratio of all occupied elements and board area.
+    '''
+    s = arr.shape[-1]
+    return np.round(np.count_nonzero(arr, axis=(1, 2)) / (s**2), 2)
+
+def subset_occupation(arr, bs):
+    '''
+    Ratio of occupied subsets and num. of subsets.
+    '''
+    s = arr.shape[-1]
+    occ = np.not_equal(arr, 0)
+    res = (occ.all(2).sum(1) + occ.all(1).sum(1)
+        + _blocks(occ, bs).all(2).sum(1))
+    return np.round(res / (3 * s), 2)
+
+def row_integrity(arr):
+    '''
+    Integrity of all rows (see 'Board.row_integrity').
+    '''
+    s = arr.shape[-1]
+    val = runs_table(s, s)[_codes(arr)].sum(1)
+    return np.round(val / (line_norm(s) * s), 2)
+
+def col_integrity(arr):
+    '''
+    Integrity of all columns (see 'Board.col_integrity').
+    '''
+    return row_integrity(arr.transpose(0, 2, 1))
+
+def block_integrity(arr, bs):
+    '''
+    Integrity of all blocks (see 'Board.block_integrity').
+    '''
+    s = arr.shape[-1]
+    val = regions_table(bs)[_codes(_blocks(arr, bs))].sum(1)
+    return np.round(val / block_norm(s, bs), 2)
+
+def integrity(arr):
+    '''
+    Overall board integrity (see 'Board.integrity').
+    '''
+    return integrity_bits(pack_many(arr), arr.shape[-1])
+
+def integrity_bits(bits_ls, s):
+    '''
+    Overall board integrity of a sequence of bitboards of size 's'.
+    Regions are flood filled on the bitboards
+    (see 'bitboard.region_sizes_bits').
+    '''
+    w = s**2+1
+    val = [sum(w - k for k in set(region_sizes_bits(bits, s)))
+           for bits in bits_ls]
+    return np.round(np.array(val, dtype=float) / (line_norm(s) * (s**2)), 2)
+
+def stats(arr, bs):
+    '''
+    All statistics of a stack of boards,
+    shape (N, len(STATS)), columns ordered as in STATS.
+    '''
+    return np.column_stack([
+        col_integrity(arr),
+        row_integrity(arr),
+        block_integrity(arr, bs),
+        occupation(arr),
+        subset_occupation(arr, bs),
+        integrity(arr)
+    ])
+
+def cached_stats(bits_ls, s, bs, cache=stats_cache):
+    '''
+    All statistics of a sequence of bitboards (see 'stats').
+    Values are looked up in 'cache' by board geometry and state,
+    only missing ones are computed (in one batch) and stored.
+    '''
+    keys = [(s, bs, bits) for bits in bits_ls]
+    rows = [cache.get(key) for key in keys]
+    miss = [i for i, row in enumerate(rows) if row is None]
+    metrics.count('cache_hits', len(rows) - len(miss))
+    metrics.count('cache_misses', len(miss))
+    if miss:
+        new = stats(unpack_many([bits_ls[i] for i in miss], s), bs).tolist()
+        for i, row in zip(miss, new):
+            rows[i] = row = tuple(row)
+            cache.put(keys[i], row)
+    return np.array(rows, dtype=float).reshape(len(rows), len(STATS))
+
+FEATURES = {}
+
+def register(name, fn):
+    '''
+    Register a genome input 'name', computed by 'fn' from the
+    statistics of N candidate boards (see 'stats') and the placed piece.
+    Genomes have one gene per registered feature, in order of registration.
+    '''
+    FEATURES[name] = fn
+
+def _stat(name):
+    i = STATS.index(name)
+    return lambda st, piece: st[:, i]
+
+for name in STATS[:4]:
+    register(name, _stat(name))
+register('piece_occupation', lambda st, piece: np.full(len(st), get_occupation(piece)))
+register('bias', lambda st, piece: np.ones(len(st)))
+for name in STATS[4:]:
+    register(name, _stat(name))
+
+def inputs(st, piece, names=None):
+    '''
+    Genome inputs of N candidate boards, shape (N, len(names)),
+    columns ordered as in 'names' (all registered features by default).
+    '''
+    return np.column_stack([FEATURES[name](st, piece) for name in names or FEATURES])
@@ -0,0 +1,95 @@
+'''
+Board geometries (board size 's', block size 'bs') and their tables.
+
+Every table is computed once per geometry and shared by all boards
+and batch functions. Tables indexed by occupation pattern have
+2**s (lines) and 2**(bs*bs) (blocks) entries, which bounds
+practical geometries to about s = 16.
+'''
+
+import numpy as np
+from functools import lru_cache
+from bdsolve.game.bitboard import subset_masks
+from bdsolve.game.moves import move_table
+from bdsolve.game.utils import region_sizes
+
+def _distinct_weights(arr, s):
+    '''
+    Sum of (s+1 - size) over the distinct sizes of free regions
+    of every array in a stack, shape (N, y, x).
+    '''
+    n, y, x = arr.shape
+    sizes = region_sizes(arr)
+    res = np.zeros((n, y*x+1), dtype=bool)
+    res[np.arange(n).repeat(y*x), sizes.ravel()] = True
+    res[:, 0] = False
+    return res @ ((s+1) - np.arange(y*x+1))
+
+def _patterns(n):
+    '''
+    All occupation patterns of 'n' elements, shape (2**n, n).
+    '''
+    return ((np.arange(1 << n)[:, None] >> np.arange(n)) & 1).astype(np.int8)
+
+@lru_cache(maxsize=None)
+def runs_table(n, s):
+    '''
+    Integrity values of all occupation patterns of a line
+    of 'n' elements, weighted as in 'Board.row_integrity'.
+    '''
+    return _distinct_weights(_patterns(n)[:, None, :], s).astype(float)
+
+@lru_cache(maxsize=None)
+def regions_table(bs):
+    '''
+    Integrity values of all occupation patterns of a block
+    of size 'bs', weighted as in 'Board.block_integrity'
+    (by the block area, so no value is negative).
+    '''
+    return _distinct_weights(
+        _patterns(bs*bs).reshape(-1, bs, bs), bs*bs).astype(float)
+
+def line_norm(s):
+    '''
+    Normalizer of the integrity statistics per line of 's'
+    elements (s*(s+1)/2, 45 for the standard board),
+    or per block of area 's'.
+    '''
+    return s*(s+1)//2
+
+def block_norm(s, bs):
+    '''
+    Normalizer of the block integrity statistic
+    (per block, times the block count).
+    '''
+    return line_norm(bs*bs) * (s//bs)**2
+
+class Geometry:
+    '''
+    A board geometry and its precomputed tables: subset masks
+    and sizes (rows, then columns, then blocks), integrity tables
+    and normalizers (of a line, and of all blocks), and the move table.
+    '''
+
+    def __init__(self, s=9, bs=3):
+        if bs < 1 or s % bs:
+            raise ValueError(f'board size {s} is not a multiple of block size {bs}')
+        self.s = s
+        self.bs = bs
+        self.bw = s//bs
+        self.masks = subset_masks(s, bs)
+        self.sizes = [s]*(2*s) + [bs**2]*(self.bw**2)
+        self.tables = (runs_table(s, s).tolist(), regions_table(bs).tolist())
+        self.norm = line_norm(s)
+        self.block_norm = block_norm(s, bs)
+
+    @property
+    def moves(self):
+        return move_table(self.s, self.bs)
+
+@lru_cache(maxsize=None)
+def geometry(s=9, bs=3):
+    '''
+    The shared geometry of boards of size 's' with block size 'bs'.
+    '''
+    return Geometry(s, bs)
@@ -0,0 +1,198 @@
+import os, hashlib, zipfile, numpy as np
+from functools import lru_cache
+from itertools import compress
+from bdsolve.game.bitboard import subset_masks, position_masks, unpack_many
+from bdsolve.game.pieces import catalog
+from bdsolve.game.utils import ndarray_key
+
+def cache_dir():
+    '''
+    Directory of on-disk caches ($BDSOLVE_CACHE or ~/.cache/bdsolve).
+    '''
+    return os.environ.get('BDSOLVE_CACHE') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'bdsolve')
+
+class MoveTable:
+    '''
+    Every placement of every piece from a piece catalog
+    on a board of size 's' with block size 'bs'.
+    Pieces are given as arrays or as their IDs in the catalog.
+
+    For each piece (in catalog order) the table holds the
+    anchor positions (y, x) in row-major order, the bitmask of
+    the occupied elements and the indices of the subsets touched
+    (rows, then columns, then blocks, as in 'subset_masks').
+    The table is saved to and loaded from disk, keyed by
+    the board geometry and the piece set.
+    '''
+
+    def __init__(self, s=9, bs=3, pieces=catalog):
+        self.s = s
+        self.bs = bs
+        self.catalog = pieces
+        self.key = hashlib.sha1(repr(
+            (s, bs, [ndarray_key(p) for p in pieces])
+        ).encode()).hexdigest()[:16]
+        self.path = os.path.join(cache_dir(), f'moves-{s}-{bs}-{self.key}.npz')
+        self._cells = {}
+        if not self.load():
+            self.build(pieces)
+            self.save()
+
+    def id(self, piece):
+        '''
+        The catalog ID of a piece (array or ID).
+        '''
+        if isinstance(piece, (int, np.integer)):
+            return int(piece)
+        return self.catalog.id(piece)
+
+    def build(self, pieces):
+        '''
+        Compute the table for a piece set.
+        '''
+        s = self.s
+        subsets = [m for ms in subset_masks(s, self.bs) for m in ms]
+        self.positions, self.masks, self.subsets = [], [], []
+        for piece in pieces:
+            pos_ls, mask_ls, sub_ls = [], [], []
+            for i, row in enumerate(position_masks(piece, s)):
+                for j, m in enumerate(row):
+                    pos_ls.append((i, j))
+                    mask_ls.append(m)
+                    sub_ls.append(tuple(
+                        k for k, sm in enumerate(subsets) if m & sm))
+            self.positions.append(pos_ls)
+            self.masks.append(mask_ls)
+            self.subsets.append(sub_ls)
+
+    def load(self):
+        '''
+        Load the table from disk. Returns False if not available
+        or unreadable (the table is then rebuilt and saved over it).
+        '''
+        try:
+            with np.load(self.path) as f:
+                piece, pos, mask, touched = (
+                    f['piece'], f['pos'], f['mask'], f['touched'])
+        except (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile):
+            return False
+        n = len(self.catalog)
+        if len(piece) and (np.any(np.diff(piece) < 0) or piece[-1] >= n):
+            return False
+        words = np.zeros((len(mask), -(-mask.shape[1] // 8) * 8), dtype=np.uint8)
+        words[:, :mask.shape[1]] = mask
+        words = words.view('<u8')
+        masks = words[:, 0].tolist()
+        for w in range(1, words.shape[1]):
+            masks = [
+                m | (x << 64*w) for m, x in zip(masks, words[:, w].tolist())]
+        positions = list(map(tuple, pos.tolist()))
+        cols = np.nonzero(touched)[1].tolist()
+        ends = np.cumsum(touched.sum(1)).tolist()
+        subsets = [tuple(cols[a:b]) for a, b in zip([0] + ends, ends)]
+        ends = np.cumsum(np.bincount(piece, minlength=n)).tolist()
+        bounds = list(zip([0] + ends, ends))
+        self.positions = [positions[a:b] for a, b in bounds]
+        self.masks = [masks[a:b] for a, b in bounds]
+        self.subsets = [subsets[a:b] for a, b in bounds]
+        return True
+
+    def save(self):
+        '''
+        Save the table to disk, atomically. Failures are ignored.
+        '''
+        s = self.s
+        nbytes = (s*s+7)//8
+        nsub = sum(map(len, subset_masks(s, self.bs)))
+        piece, pos, mask, touched = [], [], [], []
+        for k in range(len(self.catalog)):
+            for p, m, t in zip(self.positions[k], self.masks[k], self.subsets[k]):
+                piece.append(k)
+                pos.append(p)
+                mask.append(np.frombuffer(m.to_bytes(nbytes, 'little'), dtype=np.uint8))
+                row = np.zeros(nsub, dtype=bool)
+                row[list(t)] = True
+                touched.append(row)
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                np.savez(
+                    f, piece=np.array(piece, dtype=np.int16),
+                    pos=np.array(pos, dtype=np.int16).reshape(-1, 2),
+                    mask=np.array(mask, dtype=np.uint8).reshape(-1, nbytes),
+                    touched=np.array(touched, dtype=bool).reshape(-1, nsub))
+            os.replace(tmp, self.path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def moves(self, piece):
+        '''
+        Positions, masks and touched subsets of all placements of a piece.
+        '''
+        k = self.id(piece)
+        return self.positions[k], self.masks[k], self.subsets[k]
+
+    def cells(self, piece):
+        '''
+        Occupied elements of all placements of a piece
+        (in order of 'moves'), as a boolean array of shape
+        (placements, s*s). Computed once per piece.
+        '''
+        k = self.id(piece)
+        if k not in self._cells:
+            self._cells[k] = unpack_many(
+                self.masks[k], self.s).reshape(-1, self.s**2).astype(bool)
+        return self._cells[k]
+
+    def legal(self, bits, piece):
+        '''
+        Positions and masks of all placements of a piece
+        not overlapping occupied elements of bitboard 'bits'.
+        '''
+        positions, masks, _ = self.moves(piece)
+        sel = [not bits & m for m in masks]
+        return list(compress(positions, sel)), list(compress(masks, sel))
+
+@lru_cache(maxsize=None)
+def move_table(s=9, bs=3):
+    '''
+    The move table of the pieces of 'catalog' for a board geometry.
+    '''
+    return MoveTable(s, bs)
+
+def legal_moves(board, piece):
+    '''
+    All positions (y, x) where a piece can be placed
+    on a board, in row-major order.
+    '''
+    return move_table(board.s, board.bs).legal(board.bits, piece)[0]
+
+def is_dead(bits, pieces, s=9, bs=3):
+    '''
+    Quick check whether the given pieces can not all be placed
+    on bitboard 'bits', in any order.
+    Without emptying a subset, elements are only ever added,
+    so a piece that fits nowhere now never will. The board is dead
+    if such a piece exists and no subset can be completed with
+    any placements of the other pieces.
+    May miss dead boards, never reports a live one.
+    '''
+    table = move_table(s, bs)
+    stuck, free = False, 0
+    for piece in pieces:
+        fits = False
+        for m in table.moves(piece)[1]:
+            if not bits & m:
+                fits = True
+                free |= m
+        stuck = stuck or not fits
+    if not stuck:
+        return False
+    full = bits | free
+    return not any(
+        full & m == m
+        for ms in subset_masks(s, bs) for m in ms)
@@ -1,6 +1,5 @@
 import numpy as np
-from random import choice
-from bdsolve.game.utils import hashset_ndarray
+from bdsolve.game.utils import hashset_ndarray, ndarray_key
 
 _pieces = [
     # Dot
@@ -104,10 +103,93 @@ def get_occupation(p):
     '''
     Ratio of piece element count and the area of its shape.
     '''
-    return np.round(np.count_nonzero(p) / np.product(p.shape), 2)
+    i = catalog.ids.get(ndarray_key(p))
+    if i is not None:
+        return catalog.occupation[i]
+    return np.round(np.count_nonzero(p) / np.prod(p.shape), 2)
 
-def get_random3():
+class PieceCatalog:
     '''
-    Pick 3 random pieces.
+    A piece set with stable small-integer IDs (uint8, in set order),
+    so games, caches and messages can refer to pieces by ID.
+
+    Precomputed per piece: element count ('sizes'), occupation
+    (see 'get_occupation') and bounding box ('bbox', height and width).
+    Looking up the ID of a piece array from the catalog
+    itself skips hashing its contents.
+    '''
+
+    def __init__(self, pieces):
+        self.pieces = list(pieces)
+        if len(self.pieces) > 256:
+            raise ValueError('more than 256 pieces')
+        self.ids = {ndarray_key(p): i for i, p in enumerate(self.pieces)}
+        self.sizes = np.array(
+            [np.count_nonzero(p) for p in self.pieces], dtype=np.uint8)
+        self.bbox = np.array([p.shape for p in self.pieces], dtype=np.uint8)
+        self.occupation = np.round(self.sizes / self.bbox.prod(1), 2)
+        self._objs = {id(p): i for i, p in enumerate(self.pieces)}
+
+    def __len__(self):
+        return len(self.pieces)
+
+    def __getitem__(self, i):
+        return self.pieces[i]
+
+    def id(self, piece):
+        '''
+        The ID of a piece (array).
+        '''
+        i = self._objs.get(id(piece))
+        if i is None:
+            i = self.ids[ndarray_key(piece)]
+        return i
+
+catalog = PieceCatalog(all_pieces)
+
+def random_indices(rng, rounds):
     '''
-    return list(choice(all_pieces) for _ in range(3))
+    Draw the pieces of 'rounds' rounds with numpy generator 'rng',
+    as IDs in 'catalog' (indices into 'all_pieces', uint8 array
+    of shape (rounds, 3)).
+    '''
+    return rng.integers(0, len(catalog), (rounds, 3), dtype=np.uint8)
+
+def get_random3(rng=None):
+    '''
+    Pick 3 random pieces (with numpy generator 'rng').
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    return [catalog[i] for i in random_indices(rng, 1)[0]]
+
+class PieceSequence:
+    '''
+    Pieces of consecutive rounds, drawn with numpy generator 'rng'
+    in bulk, 'chunk' rounds at a time.
+    If 'indices' (see 'random_indices') is given, those rounds
+    are played first.
+    '''
+
+    def __init__(self, rng=None, chunk=64, indices=None):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.chunk = chunk
+        self.indices = (
+            np.empty((0, 3), dtype=np.uint8) if indices is None else indices)
+        self.pos = 0
+
+    def next_ids(self):
+        '''
+        The pieces of the next round as IDs (see 'catalog').
+        '''
+        if self.pos == len(self.indices):
+            self.indices = random_indices(self.rng, self.chunk)
+            self.pos = 0
+        self.pos += 1
+        return self.indices[self.pos-1]
+
+    def __next__(self):
+        return [catalog[i] for i in self.next_ids()]
+
+    def __iter__(self):
+        return self
@@ -1,11 +1,17 @@
 import numpy as np
 
+def ndarray_key(arr):
+    '''
+    Hashable key of an ndarray's shape and contents.
+    '''
+    return (arr.shape, arr.data.tobytes())
+
 def hashset_ndarray(ls):
     '''
     Deduplicate a list of ndarray objects.
     '''
     return list({
-        (arr.shape, arr.data.tobytes()): arr
+        ndarray_key(arr): arr
         for arr in ls
     }.values())
 
@@ -21,35 +27,50 @@ def runs1d(arr, val=0):
     )) == 1)[0].reshape(-1, 2)
     return runs[:, 1] - runs[:, 0]
 
+def regions2d(arr, val=0, diagonal=False):
+    '''
+    Label connected regions of 'val' in a stack of 2D arrays.
+    Optionally connect elements sharing a vertex but not an edge.
+    Labels are propagated between neighbours with array shifts
+    until stable, each region ending up with the largest flat index
+    (+1) of its elements, unique across the stack. Other elements are 0.
+    '''
+    mask = np.equal(arr, val)
+    n, y, x = mask.shape
+    pad = np.zeros((n, y+2, x+2), dtype=np.int32)
+    labels = pad[:, 1:-1, 1:-1]
+    labels[...] = np.arange(1, mask.size+1).reshape(mask.shape)
+    labels *= mask
+    shifts = [(0, 1), (2, 1), (1, 0), (1, 2)]
+    if diagonal:
+        shifts += [(0, 0), (0, 2), (2, 0), (2, 2)]
+    views = [pad[:, i:i+y, j:j+x] for i, j in shifts]
+    new = np.empty_like(labels)
+    while True:
+        new[...] = labels
+        for v in views:
+            np.maximum(new, v, out=new)
+        new *= mask
+        if np.array_equal(new, labels):
+            return new
+        labels[...] = new
+
+def region_sizes(arr, val=0, diagonal=False):
+    '''
+    Sizes of connected regions of 'val' in a stack of 2D arrays.
+    Returns an array of shape (N, y*x), holding each region's size
+    at the position of its label and 0 elsewhere.
+    '''
+    labels = regions2d(arr, val, diagonal)
+    return np.bincount(
+        labels.ravel(), minlength=labels.size+1
+    )[1:].reshape(len(labels), labels.shape[1]*labels.shape[2])
+
 def runs2d(arr, val=0, diagonal=False):
     '''
     Find bounded runs/regions of 'val' in a 2D array.
     Optionally merge runs sharing a vertex but not an edge.
     Returns a list of run sizes.
-
-    Note: ~quadratic time complexity.
-    '''
-    runs = []
-    tr = np.zeros(arr.shape)
-    i, j = 0, 0
-    for j in range(arr.shape[0]):
-        for i in range(arr.shape[1]):
-            if tr.all(): return runs
-            if tr[i, j] or arr[i, j] != val:
-                continue
-            res, st = 0, []
-            st.append((i, j))
-            while st:
-                i, j = st.pop()
-                if not tr[i, j]:
-                    tr[i, j] = 1
-                    if arr[i, j] == val:
-                        res += 1
-                        li = i < arr.shape[0]-1
-                        lj = j < arr.shape[1]-1
-                        if li: st.append((i+1, j))
-                        if lj: st.append((i, j+1))
-                        if diagonal and li and lj:
-                            st.append((i+1, j+1))
-            if res: runs.append(res)
-    return runs
+    '''
+    sizes = region_sizes(arr[None], val, diagonal)[0]
+    return sizes[sizes > 0].tolist()
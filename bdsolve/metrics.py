@@ -0,0 +1,180 @@
+'''
+Counters, timers and profiling of training runs.
+
+Hot paths count events and time sections on the global 'metrics'.
+Worker processes hand their values to the parent ('take' / 'merge'),
+which writes one record per generation to a sink ('flush').
+Timers of parallel work are summed over all processes.
+
+Profiling of 'Player.play' (with cProfile) is enabled in every process
+with the environment variable BDSOLVE_PROFILE, profiles of workers
+are merged like the counters.
+'''
+
+import os, csv, json, time, pstats, cProfile
+from contextlib import contextmanager
+
+class JSONLSink:
+    '''
+    Writes records as JSON lines to 'path' (appending).
+    '''
+
+    def __init__(self, path):
+        self.f = open(path, 'a')
+
+    def write(self, record):
+        self.f.write(json.dumps(record) + '\n')
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+class CSVSink:
+    '''
+    Writes records as CSV rows to 'path' (appending), with the fields
+    of the first record as columns.
+    '''
+
+    def __init__(self, path):
+        self.header = not os.path.exists(path) or not os.path.getsize(path)
+        self.f = open(path, 'a', newline='')
+        self.writer = None
+
+    def write(self, record):
+        if self.writer is None:
+            self.writer = csv.DictWriter(
+                self.f, list(record), extrasaction='ignore')
+            if self.header:
+                self.writer.writeheader()
+        self.writer.writerow(record)
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+def open_sink(path):
+    '''
+    A CSV sink for paths ending in '.csv', a JSON lines sink otherwise.
+    '''
+    if path.endswith('.csv'):
+        return CSVSink(path)
+    return JSONLSink(path)
+
+class _Profile:
+    '''
+    Profile data in the form accepted by 'pstats.Stats.add'.
+    '''
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+class Metrics:
+    '''
+    Counters and timers (seconds) by name, and values recorded
+    since the last flush. Records are written to 'sink' (any object
+    with a 'write' method taking a dict), if set.
+    '''
+
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.counters = {}
+        self.timers = {}
+        self.values = {}
+        self.profiler = None
+        self.profile_stats = None
+        if os.environ.get('BDSOLVE_PROFILE'):
+            self.enable_profile()
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] = \
+                self.timers.get(name, 0) + time.perf_counter() - t
+
+    def record(self, **values):
+        '''
+        Set values of the next record.
+        '''
+        self.values.update(values)
+
+    def enable_profile(self):
+        self.profiler = cProfile.Profile()
+        self.profile_stats = pstats.Stats()
+
+    @contextmanager
+    def profile(self):
+        '''
+        Profile the enclosed code, if profiling is enabled.
+        '''
+        if self.profiler is None:
+            yield
+            return
+        self.profiler.enable()
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+
+    def take(self):
+        '''
+        Counters, timers and profile data collected so far,
+        resetting them (see 'merge').
+        '''
+        data = {'counters': self.counters, 'timers': self.timers}
+        self.counters, self.timers = {}, {}
+        if self.profiler is not None:
+            self.profiler.create_stats()
+            data['profile'] = self.profiler.stats
+            self.profiler = cProfile.Profile()
+        return data
+
+    def merge(self, data):
+        '''
+        Add counters, timers and profile data taken
+        in another process (see 'take').
+        '''
+        for name, n in data['counters'].items():
+            self.count(name, n)
+        for name, t in data['timers'].items():
+            self.timers[name] = self.timers.get(name, 0) + t
+        if data.get('profile') and self.profile_stats is not None:
+            self.profile_stats.add(_Profile(data['profile']))
+
+    def flush(self, **values):
+        '''
+        Write a record of the counters, timers and values to the sink
+        and reset them. Returns the record.
+        '''
+        self.merge(self.take())
+        hits = self.counters.get('cache_hits', 0)
+        lookups = hits + self.counters.get('cache_misses', 0)
+        record = {
+            **self.values,
+            **values,
+            **self.counters,
+            'cache_hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            **{f'time_{name}': round(t, 4) for name, t in self.timers.items()},
+        }
+        self.counters, self.timers, self.values = {}, {}, {}
+        if self.sink is not None:
+            self.sink.write(record)
+        return record
+
+    def dump_profile(self, path):
+        '''
+        Write the profile data collected so far
+        (see 'pstats.Stats.dump_stats').
+        '''
+        self.merge(self.take())
+        self.profile_stats.dump_stats(path)
+
+metrics = Metrics()
@@ -0,0 +1,193 @@
+'''
+Append-only replay logs of played games.
+
+Every move is a fixed-width record ('record_dtype'): generation, genome
+(index in the population), game of the genome and round, the piece ID
+(see 'pieces.catalog'), its position, the score of the move and the
+count of subsets it cleared. A 'Recorder' buffers the moves of a player
+as tuples and converts them to records in blocks; blocks are appended
+to a log file by a 'ReplayWriter'. Logs are read with 'read', as a
+memory-mapped record array, so any number of games can be analyzed
+without loading them.
+
+The file starts with a header ('header_dtype') holding the board
+geometry and the record size, followed by the records.
+'''
+
+import os, numpy as np
+from bdsolve.game.board import Board
+from bdsolve.game.pieces import catalog
+
+record_dtype = np.dtype([
+    ('gen', '<u4'),
+    ('genome', '<u4'),
+    ('game', '<u4'),
+    ('round', '<u4'),
+    ('piece', 'u1'),
+    ('y', 'u1'),
+    ('x', 'u1'),
+    ('cleared', 'u1'),
+    ('score', '<u2'),
+])
+
+header_dtype = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u2'),
+    ('s', 'u1'),
+    ('bs', 'u1'),
+    ('size', '<u4'),
+])
+
+MAGIC = b'BDREPLAY'
+VERSION = 1
+
+class Recorder:
+    '''
+    Buffers the moves of games (see 'move'), numbering games
+    and rounds. Moves are passed to 'log' (see 'ReplayWriter')
+    in blocks of 'block' records, or collected with 'take'.
+    'gen' and 'genome' are written to the records of the current game.
+    '''
+
+    def __init__(self, log=None, block=4096):
+        self.log = log
+        self.block = block
+        self.rows = []
+        self.gen = 0
+        self.genome = 0
+        self.game = 0
+        self.round = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, game, rnd, piece, pos, score, cleared):
+        '''
+        Add a move of piece 'piece' (array) at position 'pos'
+        in the given game and round.
+        '''
+        self.rows.append((
+            self.gen, self.genome, game, rnd,
+            catalog.id(piece), *pos, cleared, score))
+        if self.log is not None and len(self.rows) >= self.block:
+            self.log.write(self.take())
+
+    def move(self, piece, pos, score, cleared):
+        '''
+        Add a move of the current game and round.
+        '''
+        self.add(self.game, self.round, piece, pos, score, cleared)
+
+    def end_round(self):
+        self.round += 1
+
+    def end_game(self, gen=None, genome=None):
+        '''
+        Start the next game, of generation 'gen' and genome
+        'genome' if given.
+        '''
+        self.game += 1
+        self.round = 0
+        if gen is not None:
+            self.gen = gen
+        if genome is not None:
+            self.genome = genome
+
+    def take(self):
+        '''
+        The moves buffered so far as a record array, clearing the buffer.
+        '''
+        rows, self.rows = self.rows, []
+        return np.array(rows, dtype=record_dtype)
+
+    def flush(self):
+        '''
+        Pass the buffered moves to the log.
+        '''
+        if self.rows:
+            self.log.write(self.take())
+
+class ReplayWriter:
+    '''
+    Appends records to the log at 'path', of games on boards of size
+    's' with block size 'bs'. An existing log must have the same
+    geometry and record layout.
+    '''
+
+    def __init__(self, path, s=9, bs=3):
+        header = np.array([(MAGIC, VERSION, s, bs, record_dtype.itemsize)],
+                          dtype=header_dtype)
+        if os.path.exists(path) and os.path.getsize(path):
+            old = np.fromfile(path, dtype=header_dtype, count=1)
+            if old.tobytes() != header.tobytes():
+                raise ValueError(f'{path} is not a replay log of this geometry')
+            self.f = open(path, 'ab')
+        else:
+            self.f = open(path, 'wb')
+            self.f.write(header.tobytes())
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write(self, records):
+        '''
+        Append a record array (see 'record_dtype').
+        '''
+        self.f.write(np.ascontiguousarray(records, dtype=record_dtype).tobytes())
+        self.f.flush()
+        self.count += len(records)
+
+    def close(self):
+        self.f.close()
+
+def read(path):
+    '''
+    The records of the log at 'path' as a read-only memory map,
+    and the board size and block size of its games.
+    '''
+    header = np.fromfile(path, dtype=header_dtype, count=1)
+    if not len(header) or header['magic'][0] != MAGIC:
+        raise ValueError(f'{path} is not a replay log')
+    if header['version'][0] != VERSION \
+            or header['size'][0] != record_dtype.itemsize:
+        raise ValueError(f'{path} has an unsupported record layout')
+    n = (os.path.getsize(path) - header_dtype.itemsize) // record_dtype.itemsize
+    s, bs = int(header['s'][0]), int(header['bs'][0])
+    if not n:
+        return np.zeros(0, dtype=record_dtype), s, bs
+    records = np.memmap(
+        path, dtype=record_dtype, mode='r',
+        offset=header_dtype.itemsize, shape=(n,))
+    return records, s, bs
+
+def games(records):
+    '''
+    Start and end indices of the games in 'records', games being
+    runs of records of the same generation, genome and game.
+    '''
+    n = len(records)
+    if not n:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    change = np.zeros(n, dtype=bool)
+    change[0] = True
+    for name in ('gen', 'genome', 'game'):
+        col = records[name]
+        change[1:] |= col[1:] != col[:-1]
+    starts = np.flatnonzero(change)
+    return starts, np.append(starts[1:], n)
+
+def replay(records, s=9, bs=3):
+    '''
+    Replay the moves of a game (a slice of records, see 'games')
+    from an empty board. Yields the board after every move.
+    '''
+    b = Board(s, bs)
+    for r in records:
+        b.place(catalog[r['piece']], (int(r['y']), int(r['x'])))
+        b.reduce_subsets()
+        b.commit()
+        yield b
@@ -1,20 +1,33 @@
 import numpy as np
-from random import choice
-from itertools import permutations
 from bdsolve.game.board import Board
-from bdsolve.game.pieces import get_occupation, get_random3
+from bdsolve.game import features
+from bdsolve.game.batch import BoardBatch
+from bdsolve.game.bitboard import play_bits, unpack_many
+from bdsolve.game.moves import move_table, is_dead
+from bdsolve.game.pieces import PieceSequence, catalog
+from bdsolve.game.utils import ndarray_key
+from bdsolve.metrics import metrics
+from bdsolve.solver.planners import GreedyPlanner
+from bdsolve.solver.network import Network
+from bdsolve.solver.store import GenomeStore
 
 class GA:
+    '''
+    Genetic algorithm over a population of genomes (rows of 'population')
+    of 'gene_count' genes (one per registered feature by default),
+    kept in a 'GenomeStore'.
+    All operators work on the whole population array at once,
+    drawing from a generator seeded with 'seed'.
+    '''
 
-    def __init__(self, pop_count=100):
-        self.pop_count = pop_count
+    def __init__(self, pop_count=100, seed=None, gene_count=None):
+        self.store = GenomeStore(gene_count or len(features.FEATURES), pop_count)
+        self.rng = np.random.default_rng(seed)
         self.crossover_rate = 0.25
         self.mutation_rate = 0.4
-
-        self.population = np.zeros((pop_count, 8))
-        self.pop_score = np.zeros(pop_count)
-        self.pop_success_rate_s = np.zeros(pop_count)
-        self.pop_success_rate_c = np.zeros(pop_count)
+        self.parent_count = 2
+        self.mutation_genes = 1
+        self.mutation_offset = 0
         self.total_success_rate = [0, 0, 0]
 
         self.gen_num = 0
@@ -25,197 +38,460 @@ class GA:
         '''
         Create a population with random genomes.
         '''
-        for i in range(self.pop_count):
-            self.population[i] = self.get_random_gene(np.zeros(8))
+        st = self.store
+        st.genes[:] = self.get_random_gene(st.genes.shape)
+        st.lineage[:] = st.new_lineages(len(st))
+        st.age[:] = 0
         self.total_success_rate = [0, 0, 0]
-        self.pop_success_rate_s *= 0
-        self.pop_success_rate_c *= 0
-        self.pop_score *= 0
+        st.rate_s[:] = 0
+        st.rate_c[:] = 0
+        st.score[:] = 0
         self.pop_num = 0
 
-    def new_child(self, g1, g2, mutate=True):
+    def resize(self, pop_count):
         '''
-        Create a child genome from two parents.
-        Perform crossover and mutation of single genes.
+        Change the population size, adding random genomes (played
+        last in the current generation) or removing those with the
+        lowest success rate. Removing genomes restarts the current
+        generation, dropping the scores collected so far.
+        '''
+        st = self.store
+        n = len(st)
+        if pop_count > n:
+            st.append(self.get_random_gene((pop_count-n, st.gene_count)))
+        elif pop_count < n:
+            st.remove(np.argsort(st.rate_s, kind='stable')[:n-pop_count])
+            st.score[:] = 0
+            self.pop_num = 0
+
+    @property
+    def pop_count(self):
+        return len(self.store)
+
+    @property
+    def population(self):
+        return self.store.genes
+
+    @property
+    def pop_score(self):
+        return self.store.score
+
+    @property
+    def pop_success_rate_s(self):
+        return self.store.rate_s
 
-        TODO: n parents, crossover rules, more mutation methods
-              (random offset, multiple genes, ...)
+    @property
+    def pop_success_rate_c(self):
+        return self.store.rate_c
+
+    def new_children(self, parents, mutate=True):
+        '''
+        Create a child genome from each row of parent genomes
+        (array of shape (children, n parents, genes)).
+        Perform uniform crossover, taking every gene from a random parent,
+        then mutate 'mutation_genes' random genes of a child with
+        probability 'mutation_rate': by a random offset (normally
+        distributed with deviation 'mutation_offset', clipped to the gene
+        range) if 'mutation_offset' is nonzero, else to a random gene.
         '''
-        g = np.zeros(8)
-        mut_i = (np.random.choice(np.arange(0, 8))
-        if abs(np.random.random()) < self.mutation_rate
-        else -1)
-        for i in range(8):
-            if mutate and i == mut_i:
-                gene = float(self.get_random_gene(0))
+        k, n, m = parents.shape
+        pick = self.rng.integers(0, n, (k, m))
+        g = np.take_along_axis(parents, pick[:, None], 1)[:, 0]
+        if mutate:
+            mut = self.rng.random(k) < self.mutation_rate
+            genes = self.rng.random((k, m)).argsort(1) < self.mutation_genes
+            mask = mut[:, None] & genes
+            if self.mutation_offset:
+                g[mask] = np.clip(
+                    g[mask] + self.rng.normal(
+                        0, self.mutation_offset, mask.sum()), -10, 10)
             else:
-                if abs(np.random.random()) < 0.5:
-                    gene = g1[i]
-                else:
-                    gene = g2[i]
-            g[i] = gene
+                g[mask] = self.get_random_gene(mask.sum())
         return g
 
+    def new_child(self, g1, g2, mutate=True):
+        '''
+        Create a child genome from two parents (see 'new_children').
+        '''
+        return self.new_children(np.array([[g1, g2]]), mutate)[0]
+
     def new_generation(self):
         '''
         Advance to the next generation.
         Once the fitness of every genome in the population is evaluated,
         perform selection according to current and past performance, then
-        replace some part of the population with children of surviving genomes.
+        replace some part of the population with children of 'parent_count'
+        surviving genomes. Children start at age 0, in the lineage
+        of their first parent.
 
-        TODO: more selection methods, n parents, different selection criterion,
-              variable population size, aging, ...
+        TODO: more selection methods, different selection criterion, ...
         '''
-        parents, reborn = [], []
-
-        best_genome = np.argmax(self.pop_score)
-        worst_genome = np.argmin(self.pop_score)
-        fitness = np.vectorize(lambda i: 1-(1/(1+i)))(self.pop_score)
-        score_sum = np.sum(self.pop_score)
-        fitness_sum = np.sum(fitness)
+        score = self.pop_score
+        best_genome = int(np.argmax(score))
+        worst_genome = int(np.argmin(score))
+        score_sum = np.sum(score)
 
-        print('best: ', best_genome)
-        print('worst: ', worst_genome)
+        s, c = self.pop_success_rate_s, self.pop_success_rate_c
+        s[:] = (s*c + score/max(score[best_genome], 1)) / (c+1)
+        c += 1
 
-        for i, score in enumerate(self.pop_score):
-            s = self.pop_success_rate_s[i]
-            c = self.pop_success_rate_c[i]
-            self.pop_success_rate_s[i] = s*c+(score/self.pop_score[best_genome])/(c+1)
-            self.pop_success_rate_c[i] += 1
-
-        b, w, c = self.total_success_rate
-        self.total_success_rate[0] = (b*c+self.pop_success_rate_s[best_genome])/(c+1)
-        self.total_success_rate[1] = (w*c+self.pop_success_rate_s[worst_genome])/(c+1)
+        b, w, n = self.total_success_rate
+        self.total_success_rate[0] = (b*n+s[best_genome])/(n+1)
+        self.total_success_rate[1] = (w*n+s[worst_genome])/(n+1)
         self.total_success_rate[2] += 1
 
-        for i, score in enumerate(self.pop_score):
-            s = self.pop_success_rate_s[i]
-            c = self.pop_success_rate_c[i]
-            if (abs(np.random.random()) < 0.70
-            and (s < self.total_success_rate[1]*1.2
-            or i == worst_genome) and c > 3):
-                reborn.append(i)
-            if (s > self.total_success_rate[1]*1.2
-            or i == best_genome):
-                parents.append(i)
+        limit = self.total_success_rate[1]*1.2
+        idx = np.arange(self.pop_count)
+        reborn = np.flatnonzero(
+            (self.rng.random(self.pop_count) < 0.70)
+            & ((s < limit) | (idx == worst_genome)) & (c > 3))
+        parents = np.flatnonzero((s > limit) | (idx == best_genome))
 
-        print('rip: ', reborn)
-        print('par: ', parents)
+        metrics.record(
+            best=best_genome, worst=worst_genome,
+            reborn=len(reborn), parents=len(parents))
 
+        self.store.age[:] += 1
         if len(reborn) and len(parents) > 1:
-            for i in reborn:
-                self.population[i] = self.new_child(
-                    self.population[choice(parents)],
-                    self.population[choice(parents)]
-                )
-                self.pop_success_rate_s[i] = 0
-                self.pop_success_rate_c[i] = 0
+            pick = self.rng.choice(parents, (len(reborn), self.parent_count))
+            self.population[reborn] = self.new_children(self.population[pick])
+            self.store.lineage[reborn] = self.store.lineage[pick[:, 0]]
+            self.store.age[reborn] = 0
+            s[reborn] = 0
+            c[reborn] = 0
 
         self.gen_num += 1
         self.pop_num = 0
         return score_sum
 
-    @staticmethod
-    @np.vectorize
-    def get_random_gene(_):
+    def get_random_gene(self, size=None):
         '''
-        Create a random gene (number between -10 and 10).
+        Create random genes (numbers between -10 and 10,
+        in steps of 0.01) of shape 'size'.
 
         TODO: separate genes into their own class
         '''
-        return (np.math.floor(abs(np.random.random())*2000)-1000)/100
+        return self.rng.integers(-1000, 1000, size) / 100
 
 class Player:
+    '''
+    Plays the game with the genomes of a GA population,
+    or with a single fixed genome if 'genome' is given.
+    Pieces are drawn in bulk with numpy generator 'rng' (see 'PieceSequence'),
+    the moves of each round are chosen by 'planner'
+    (see 'solver.planners', greedy by default).
+    The GA, the piece draws (unless 'rng' is given) and the lookahead
+    of the planner ('plan_seed') use generators spawned from 'seed'
+    (int or SeedSequence, left unchanged). The board has size 's' and block size 'bs'.
+    Genomes are decoded into 'network'
+    (see 'solver.network', linear by default) with the features named
+    in 'feature_names' as inputs (all registered features by default).
+    If 'recorder' is given, every move played is recorded
+    (see 'bdsolve.replay').
+    If 'cache' is given (e.g. 'features.stats_cache'), statistics of
+    candidate boards are looked up in it (see 'features.cached_stats').
+    This only pays off when the same boards recur, as when many
+    genomes play the same piece sequences.
+    '''
 
-    def __init__(self):
-        self.g = GA()
+    decimals = 9
+
+    def __init__(self, genome=None, rng=None, pop_count=100, planner=None,
+                 seed=None, feature_names=None, network=None, s=9, bs=3,
+                 recorder=None, cache=None):
+        self.board = Board(s, bs)
+        self.feature_names = tuple(feature_names or features.FEATURES)
+        self.network = network or Network()
+        n = len(self.feature_names)
+        if self.network.cells:
+            n += self.board.s**2
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        ga_seed, piece_seed, self.plan_seed = np.random.SeedSequence(
+            seed.entropy, spawn_key=seed.spawn_key).spawn(3)
+        self.g = (
+            GA(pop_count, ga_seed, self.network.gene_count(n))
+            if genome is None else None)
+        self.fixed_genome = genome
+        self.pieces = PieceSequence(
+            np.random.default_rng(piece_seed) if rng is None else rng)
+        self.planner = planner or GreedyPlanner()
+        self.recorder = recorder
+        self.cache = cache
         self.best_rate_genome = None
         self.best_score_genome = None
 
-        self.board = Board()
         self.score = 0
         self.hi_score = 0
         self.avg_score = 0
         self.avg_scores = []
 
+    @property
+    def genome(self):
+        '''
+        The genome currently playing.
+        '''
+        if self.g is None:
+            return self.fixed_genome
+        return self.g.population[self.g.pop_num]
+
     def evaluate(self, piece, pos, b):
         '''
-        View the current genome as a (shallow) neural network.
+        View the current genome as a neural network.
         Evaluate with properties of board 'b' as its input,
         if piece 'piece' would be at position 'pos'.
-
-        TODO: phenotype from genome (encode full NN), use more layers (deep NN)
         '''
-        g = self.g.population[self.g.pop_num]
-        b = b.copy()
         b.place(piece, pos)
-        return np.sum(g * np.array([
-            b.col_integrity,
-            b.row_integrity,
-            b.block_integrity,
-            b.occupation,
-            get_occupation(piece),
-            1,
-            b.subset_occupation,
-            0#b.integrity
-        ]))
+        st = b.stats()
+        cells = b.board[None].copy() if self.network.cells else None
+        b.undo()
+        return self.evaluate_stats(piece, st[None], cells)[0]
+
+    def evaluate_stats(self, piece, st, cells=None):
+        '''
+        Evaluate the current genome for candidate boards
+        given by their statistics (see 'features.stats'),
+        with the features in 'feature_names' as inputs,
+        followed by the board cells 'cells' (N, s, s)
+        if the network reads them.
+        Returns an array of N values, rounded to 'decimals' places.
+        '''
+        x = features.inputs(st, piece, self.feature_names)
+        if self.network.cells:
+            x = np.column_stack([x, cells.reshape(len(x), cells.shape[1]*cells.shape[2])])
+        # The summation order of the products depends on the batch size,
+        # rounding makes equal values compare equal in any batch
+        return np.round(self.network.forward(self.genome, x), self.decimals)
+
+    @staticmethod
+    def select(vals):
+        '''
+        Index of the optimal (lowest) value, treating zero as
+        no value. Returns None if there is no optimal value.
+        '''
+        z = np.flatnonzero(vals == 0)
+        start = z[-1]+1 if z.size else 0
+        if start >= len(vals):
+            return None
+        return start + int(np.argmin(vals[start:]))
+
+    def move_values(self, pairs, s, bs):
+        '''
+        Evaluate every legal position of each piece on its board
+        (pairs of bitboard and piece, board size 's', block size 'bs')
+        using the current genome, all candidates in one batch.
+        Returns a list of (positions, absolute values).
+        '''
+        with metrics.timer('movegen'):
+            table = move_table(s, bs)
+            legal = [table.legal(bits, piece) for bits, piece in pairs]
+            cands = [
+                bits | m
+                for (bits, _), (_, masks) in zip(pairs, legal)
+                for m in masks
+            ]
+        metrics.count('moves', len(cands))
+        with metrics.timer('evaluate'):
+            if self.cache is not None:
+                st = features.cached_stats(cands, s, bs, self.cache)
+                cells = unpack_many(cands, s) if self.network.cells else None
+            else:
+                cells = unpack_many(cands, s)
+                st = (features.stats(cells, bs) if cands
+                      else np.zeros((0, len(features.STATS))))
+                if not self.network.cells:
+                    cells = None
+            res, n = [], 0
+            for (_, piece), (positions, masks) in zip(pairs, legal):
+                k = n + len(masks)
+                res.append((positions, np.abs(self.evaluate_stats(
+                    piece, st[n:k], None if cells is None else cells[n:k]))))
+                n = k
+        return res
+
+    def best_moves(self, pairs, s, bs, memo):
+        '''
+        Find the optimal position of each piece on its board
+        (see 'move_values'). Results are stored in (and looked up
+        from) 'memo', keyed by board state and piece.
+        Returns a list of (position, value), or (None, 0) for pieces
+        without a legal position.
+        '''
+        keys = [(bits, ndarray_key(piece)) for bits, piece in pairs]
+        todo = {}
+        for key, pair in zip(keys, pairs):
+            if key not in memo:
+                todo[key] = pair
+        if todo:
+            for key, (positions, vals) in zip(
+                todo, self.move_values(list(todo.values()), s, bs)):
+                k = self.select(vals)
+                memo[key] = (None, 0) if k is None else (positions[k], vals[k])
+        return [memo[key] for key in keys]
+
+    def plan(self, pieces):
+        '''
+        Find the optimal order and positions of the given pieces
+        on the player's board (see 'plan_many').
+        Returns a list of (piece, position) or None.
+        '''
+        b = self.board
+        return self.plan_many([(b.bits, pieces)], b.s, b.bs)[0]
+
+    def plan_many(self, roots, s=None, bs=None):
+        '''
+        Find the optimal order and positions of the given pieces
+        for several boards (pairs of bitboard and pieces) at once,
+        using the current genome to evaluate a possible sequence of decisions.
+        Orders are searched as a tree, level by level: common prefixes
+        are shared, identical pieces are tried once per node, and all
+        placements of a level (of all boards) are evaluated in one batch,
+        memoized per board state, giving the same result as trying
+        every permutation in turn. Nodes where the remaining pieces
+        can not all be placed (see 'is_dead') are dropped unevaluated.
+        Boards have the geometry of the player's board by default.
+        Returns a list of (piece, position) or None for every board.
+        '''
+        s, bs = s or self.board.s, bs or self.board.bs
+        memo = {}
+        opt = [[0, None] for _ in roots]
+        nodes = [
+            (r, bits, [], list(pieces), 0)
+            for r, (bits, pieces) in enumerate(roots)
+        ]
+        while nodes:
+            pairs, children = [], []
+            for node in nodes:
+                _, bits, _, rest, _ = node
+                if is_dead(bits, rest, s, bs):
+                    continue
+                uniq = {}
+                for i, piece in enumerate(rest):
+                    uniq.setdefault(ndarray_key(piece), i)
+                for i in uniq.values():
+                    pairs.append((bits, rest[i]))
+                    children.append((node, i))
+            nodes = []
+            for ((r, bits, moves, rest, val_sum), i), (pos, val) in zip(
+                children, self.best_moves(pairs, s, bs, memo)):
+                if pos is None:
+                    continue
+                move = (rest[i], pos)
+                bits, _ = play_bits(bits, [move], s, bs)
+                moves = moves + [move]
+                rest = rest[:i] + rest[i+1:]
+                val_sum += val
+                if rest:
+                    nodes.append((r, bits, moves, rest, val_sum))
+                elif opt[r][0] > val_sum or not opt[r][0]:
+                    opt[r][:] = val_sum, moves
+        return [moves for _, moves in opt]
 
     def play(self):
         '''
         Play a round (3 moves) of the current game with the current genome.
-        Try to find the optimal order and positions of the 3 given pieces
-        using the current genome to evaluate a possible sequence of decisions.
+        The order and positions of the 3 given pieces are chosen by
+        the planner.
         Returns the score or False if no more legal moves are possible.
+        Profiled if enabled (see 'bdsolve.metrics').
+        '''
+        with metrics.profile():
+            moves = self.planner.plan(self, next(self.pieces))
+            if moves:
+                score = 0
+                rec = self.recorder
+                for piece, pos in moves:
+                    sc = self.board.place(piece, pos)
+                    if rec is not None:
+                        cleared = self.board.full_subsets
+                    ore = self.board.reduce_subsets()
+                    score += (sc+ore)
+                    if rec is not None:
+                        rec.move(piece, pos, sc+ore, cleared)
+                self.board.commit()
+                if rec is not None:
+                    rec.end_round()
+                return score
+            else:
+                return False
 
-        TODO: optimize for score (Monte Carlo search)
-        '''
-        opt_val_sum = 0
-        opt_order = []
-        opt_positions = []
-        pieces = get_random3()
-        for order in permutations(pieces):
-            b = self.board.copy()
-            val_sum = 0
-            pos_ls = []
-            for piece in order:
-                y, x = piece.shape
-                opt_val = 0
-                opt_pos = (0, 0)
-                for i in range(1+b.s-y):
-                    for j in range(1+b.s-x):
-                        if not 2 in (b.board[i:i+y, j:j+x] + piece):
-                            val = abs(self.evaluate(piece, (i, j), b))
-                            if opt_val > val or not opt_val:
-                                opt_val = val
-                                opt_pos = (i, j)
-                if opt_val:
-                    val_sum += opt_val
-                    pos_ls.append(opt_pos)
-                    b.place(piece, opt_pos)
-                    b.reduce_subsets()
-                else:
-                    break
-            if len(pos_ls) == 3:
-                if opt_val_sum > val_sum or not opt_val_sum:
-                    opt_val_sum = val_sum
-                    opt_positions = pos_ls
-                    opt_order = order
-        if opt_val_sum:
-            score = 0
-            for piece, pos in zip(opt_order, opt_positions):
-                sc = self.board.place(piece, pos)
-                ore = self.board.reduce_subsets()
-                score += (sc+ore)
-            return score
-        else:
-            return False
+    def play_game(self):
+        '''
+        Play a full game from an empty board with the current genome.
+        Returns the final score.
+        '''
+        self.board.reset()
+        score = 0
+        s = self.play()
+        while s:
+            score += s
+            s = self.play()
+        metrics.count('games')
+        if self.recorder is not None:
+            self.recorder.end_game()
+        return score
+
+    def play_games(self, sequences):
+        '''
+        Play a full game from an empty board on each of the given
+        piece sequences (see 'PieceSequence') with the current genome,
+        all games in lockstep (see 'BoardBatch'), the rounds of all games
+        planned in one batch (see 'plan_many'), dead games ended
+        before planning (see 'BoardBatch.end_dead').
+        The moves are those of the greedy planner.
+        Returns the final scores.
+        '''
+        b, rec = self.board, self.recorder
+        batch = BoardBatch(len(sequences), b.s, b.bs)
+        played = [[] for _ in sequences]
+        rnd = 0
+        while batch.alive.any():
+            games = np.flatnonzero(batch.alive)
+            ids = np.array([sequences[g].next_ids() for g in games])
+            with metrics.profile():
+                live = batch.end_dead(games, ids)
+                games, ids = games[live], ids[live]
+                bits = batch.bits()
+                plans = self.plan_many([
+                    (bits[g], [catalog[k] for k in i])
+                    for g, i in zip(games, ids)
+                ], b.s, b.bs)
+                batch.apply(games, plans)
+            if rec is not None:
+                score = batch.step_score.tolist()
+                cleared = batch.step_cleared.tolist()
+                for g, moves in zip(games, plans):
+                    for t, (piece, pos) in enumerate(moves or ()):
+                        played[g].append(
+                            (rnd, piece, pos, score[g][t], cleared[g][t]))
+            rnd += 1
+        metrics.count('games', len(sequences))
+        if rec is not None:
+            for moves in played:
+                for move in moves:
+                    rec.add(rec.game, *move)
+                rec.end_game()
+        return batch.score.tolist()
+
+    def end_generation(self):
+        '''
+        Advance the GA to the next generation once all
+        scores are known and update the statistics.
+        '''
+        score_sum = self.g.new_generation()
+        self.avg_score = np.round(score_sum / self.g.pop_count, 2)
+        self.avg_scores.append(self.avg_score)
+        self.best_rate_genome = \
+            self.g.population[np.argmax(self.g.pop_success_rate_s)]
+        self.best_score_genome = \
+            self.g.population[np.argmax(self.g.pop_score)]
+        self.hi_score = int(np.max(self.g.pop_score))
 
     def learn(self):
         '''
         Optimize using the genetic approach.
-
-        TODO: parallel score evaluation, more statistics reporting,
-              save to/resume from storage
+        Plays one round per call, see 'solver.train' for headless,
+        parallel training with checkpoints and per-generation metrics.
         '''
         s = self.play()
         if s:
@@ -227,12 +503,7 @@ class Player:
             if self.g.pop_num < self.g.pop_count:
                 self.board.reset()
             else:
-                score_sum = self.g.new_generation()
-                self.avg_score = np.round(score_sum / self.g.pop_count, 2)
-                self.avg_scores.append(self.avg_score)
-                self.best_rate_genome = \
-                    self.g.population[np.argmax(self.g.pop_success_rate_s)]
-                self.best_score_genome = \
-                    self.g.population[np.argmax(self.g.pop_score)]
-                self.hi_score = int(np.max(self.g.pop_score))
+                self.end_generation()
                 self.board.reset()
+            if self.recorder is not None:
+                self.recorder.end_game(self.g.gen_num, self.g.pop_num)
@@ -0,0 +1,58 @@
+import numpy as np
+
+class Network:
+    '''
+    Phenotype of a genome: a multilayer perceptron with hidden layers
+    of sizes 'hidden' (tanh activations) and a single linear output.
+    If 'cells' is set, the occupation of every cell of the board is
+    an input, in addition to the board features.
+
+    The genome holds the weights and biases of every hidden layer and
+    the weights of the output layer, in order. Without hidden layers
+    the genome is the weight vector of the inputs.
+    Weights feeding a hidden layer are scaled by 1/sqrt(fan-in),
+    so genes stay in the same range for any layout.
+    '''
+
+    def __init__(self, hidden=(), cells=False):
+        self.hidden = tuple(hidden)
+        self.cells = cells
+
+    def shapes(self, n):
+        '''
+        Shapes of the weights of all layers, for 'n' inputs.
+        '''
+        sizes = (n, *self.hidden, 1)
+        return list(zip(sizes[:-1], sizes[1:]))
+
+    def gene_count(self, n):
+        '''
+        Length of a genome for 'n' inputs.
+        '''
+        return sum(a*b + b for a, b in self.shapes(n)) - 1
+
+    def decode(self, genome, n):
+        '''
+        Weights and biases of all layers (the bias of
+        the output layer being None), for 'n' inputs.
+        '''
+        layers, i = [], 0
+        for k, (a, b) in enumerate(self.shapes(n)):
+            w = genome[i:i+a*b].reshape(a, b)
+            i += a*b
+            if k < len(self.hidden):
+                layers.append((w / np.sqrt(a), genome[i:i+b]))
+                i += b
+            else:
+                layers.append((w, None))
+        return layers
+
+    def forward(self, genome, x):
+        '''
+        Output of the network for a batch of inputs
+        'x' of shape (N, n). Returns an array of N values.
+        '''
+        *hidden, (w, _) = self.decode(genome, x.shape[1])
+        for wh, bh in hidden:
+            x = np.tanh(x @ wh + bh)
+        return (x @ w)[:, 0]
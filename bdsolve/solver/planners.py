@@ -0,0 +1,261 @@
+import time, numpy as np
+from bdsolve.game.batch import BoardBatch
+from bdsolve.game.bitboard import play_bits
+from bdsolve.game.pieces import catalog, random_indices
+from bdsolve.game.utils import ndarray_key
+from bdsolve.metrics import metrics
+
+class Planner:
+    '''
+    Chooses the moves of a round for a player.
+
+    'plan' returns the pieces with their positions, in order of
+    placement on the player's board, or None if not all of them
+    can be placed.
+    Lookahead planners simulate future rounds with pieces drawn
+    from generators spawned from the player's 'plan_seed', leaving
+    the game's piece sequence untouched. Planners hold no state,
+    so a planner can be shared by any number of games.
+
+    With a time 'budget' (seconds per round), rollout batches are
+    sized from the measured cost of the previous batch and cut off
+    at the deadline between simulated rounds; the beam search
+    of the round always runs in full. Rollouts played are counted
+    in the global metrics ('rollouts', and 'rounds_without_rollouts'
+    for rounds decided by the beam search alone).
+    '''
+
+    def plan(self, player, pieces):
+        raise NotImplementedError
+
+    def candidates(self, player, pieces, width):
+        '''
+        Beam search over the moves of a round. Every level places
+        one more piece, keeping the 'width' partial plans with
+        the lowest sum of (absolute) genome values.
+        Returns up to 'width' complete plans, best first
+        (possibly none, even if the greedy search finds one).
+        '''
+        b = player.board
+        s, bs = b.s, b.bs
+        nodes = [(0, b.bits, [], list(pieces))]
+        for _ in range(len(pieces)):
+            pairs, parents = [], []
+            for node in nodes:
+                _, bits, _, rest = node
+                uniq = {}
+                for i, piece in enumerate(rest):
+                    uniq.setdefault(ndarray_key(piece), i)
+                for i in uniq.values():
+                    pairs.append((bits, rest[i]))
+                    parents.append((node, i))
+            children = []
+            for k, (positions, vals) in enumerate(player.move_values(pairs, s, bs)):
+                val_sum = parents[k][0][0]
+                for pos, val in zip(positions, vals.tolist()):
+                    children.append((val_sum + val, k, pos))
+            children.sort(key=lambda c: c[0])
+            nodes = []
+            for val_sum, k, pos in children[:width]:
+                (_, bits, moves, rest), i = parents[k]
+                move = (rest[i], pos)
+                bits, _ = play_bits(bits, [move], s, bs)
+                nodes.append((val_sum, bits, moves + [move], rest[:i] + rest[i+1:]))
+        return [moves for _, _, moves, _ in nodes]
+
+    def choices(self, player, pieces, width):
+        '''
+        The candidate plans of a round (see 'candidates') and
+        their end states (pairs of bitboard and score, see 'play_bits').
+        Without a choice to make, returns the only plan (the greedy
+        plan if the beam found none, possibly None) and no end states.
+        '''
+        b = player.board
+        cands = self.candidates(player, pieces, width)
+        if len(cands) < 2:
+            return [cands[0] if cands else player.plan(pieces)], []
+        return cands, [play_bits(b.bits, moves, b.s, b.bs) for moves in cands]
+
+    @staticmethod
+    def batch_size(k, deadline, cost):
+        '''
+        Size of the next rollout batch: at most 'k', fitting before
+        'deadline' (if set) given the 'cost' (seconds) of a rollout
+        measured so far (a single rollout if not yet measured).
+        Returns 0 once the deadline has passed.
+        '''
+        if deadline is None:
+            return k
+        left = deadline - time.perf_counter()
+        if left <= 0:
+            return 0
+        if cost is None:
+            return 1
+        return min(k, int(left / cost))
+
+    def simulate(self, player, starts, rounds, seeds, deadline=None):
+        '''
+        Play up to 'rounds' rounds from each bitboard in 'starts'
+        with the player's genome (greedy), drawing all pieces at once
+        from a generator seeded with the corresponding seed.
+        All games advance in lockstep (see 'BoardBatch'),
+        their rounds planned in one batch, dead games ended
+        before planning (see 'BoardBatch.end_dead').
+        Returns the score of every game, or None if 'deadline'
+        (see 'time.perf_counter') passed before the last round.
+        '''
+        b = player.board
+        s, bs = b.s, b.bs
+        pieces = [
+            random_indices(np.random.default_rng(seed), rounds)
+            for seed in seeds
+        ]
+        batch = BoardBatch.from_bits(starts, s, bs)
+        for r in range(rounds):
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
+            games = np.flatnonzero(batch.alive)
+            games = games[batch.end_dead(games, [pieces[g][r] for g in games])]
+            if not games.size:
+                break
+            bits = batch.bits()
+            plans = player.plan_many([
+                (bits[g], [catalog[k] for k in pieces[g][r]])
+                for g in games
+            ], s, bs)
+            batch.apply(games, plans)
+        return batch.score.tolist()
+
+class GreedyPlanner(Planner):
+    '''
+    Plays the order and positions with the lowest sum of
+    genome values within the round (see 'Player.plan').
+    '''
+
+    def plan(self, player, pieces):
+        return player.plan(pieces)
+
+class BeamPlanner(Planner):
+    '''
+    Beam search over the moves of a round (see 'candidates'),
+    looking ahead across future rounds: each of the 'width'
+    surviving plans is scored by its own score plus the mean score
+    of greedy continuations of 'depth' rounds. All plans are continued
+    with the same sampled pieces, 'batch' games at a time, until
+    'samples' continuations per plan are played or 'budget' seconds
+    have passed (see 'Planner').
+    '''
+
+    def __init__(self, width=8, depth=2, samples=16, batch=64,
+                 budget=None):
+        self.width = width
+        self.depth = depth
+        self.samples = samples
+        self.batch = batch
+        self.budget = budget
+
+    def plan(self, player, pieces):
+        deadline = time.perf_counter() + self.budget if self.budget else None
+        cands, ends = self.choices(player, pieces, self.width)
+        if not ends:
+            return cands[0]
+        total = np.zeros(len(cands))
+        n, cost = 0, None
+        while n < self.samples:
+            k = self.batch_size(
+                max(1, min(self.batch // len(cands), self.samples - n)),
+                deadline, cost)
+            if not k:
+                break
+            t = time.perf_counter()
+            seeds = player.plan_seed.spawn(k)
+            scores = self.simulate(
+                player, [bits for bits, _ in ends for _ in seeds],
+                self.depth, seeds * len(cands), deadline)
+            if scores is None:
+                break
+            cost = (time.perf_counter() - t) / k
+            total += np.array(scores).reshape(len(cands), k).sum(1)
+            n += k
+        metrics.count('rollouts', n * len(cands))
+        if not n:
+            metrics.count('rounds_without_rollouts')
+        value = np.array([score for _, score in ends]) + total / max(n, 1)
+        return cands[int(np.argmax(value))]
+
+class UCBPlanner(Planner):
+    '''
+    Bandit search over the moves of a round. The arms are
+    the 'width' best plans of a beam search (see 'candidates'),
+    each valued by its own score plus the scores of random greedy
+    continuations of 'depth' rounds (a flat search, nothing below
+    the plans is expanded). Rollouts are allocated by UCB1
+    ('c' being the exploration constant), 'batch' at a time
+    in lockstep, until 'rollouts' are played or 'budget' seconds
+    have passed (see 'Planner'). The plan with the highest mean
+    value is played.
+
+    This stands in for a Monte Carlo tree search over future draws,
+    which is not implemented: the next round's draw has
+    len(catalog)**3 outcomes (over 10**5), so within any practical
+    rollout count a chance node below a plan almost never sees
+    the same draw twice, and decision nodes below it would never
+    be expanded. Such a tree degenerates into these flat rollouts.
+    '''
+
+    def __init__(self, width=8, depth=3, rollouts=128, batch=32,
+                 budget=None, c=1.4):
+        self.width = width
+        self.depth = depth
+        self.rollouts = rollouts
+        self.batch = batch
+        self.budget = budget
+        self.c = c
+
+    def plan(self, player, pieces):
+        deadline = time.perf_counter() + self.budget if self.budget else None
+        cands, ends = self.choices(player, pieces, self.width)
+        if not ends:
+            return cands[0]
+        count = np.zeros(len(cands))
+        total = np.zeros(len(cands))
+        done, cost = 0, None
+        while done < self.rollouts:
+            n = self.batch_size(
+                min(self.batch, self.rollouts - done), deadline, cost)
+            if not n:
+                break
+            t = time.perf_counter()
+            arms = []
+            pending = count.copy()
+            mean = total / np.maximum(count, 1)
+            mean /= max(mean.max(), 1)
+            for _ in range(n):
+                if (pending == 0).any():
+                    i = int(np.argmin(pending))
+                else:
+                    i = int(np.argmax(mean + self.c * np.sqrt(
+                        np.log(pending.sum()) / pending)))
+                arms.append(i)
+                pending[i] += 1
+            scores = self.simulate(
+                player, [ends[i][0] for i in arms], self.depth,
+                player.plan_seed.spawn(len(arms)), deadline)
+            if scores is None:
+                break
+            cost = (time.perf_counter() - t) / n
+            for i, score in zip(arms, scores):
+                count[i] += 1
+                total[i] += ends[i][1] + score
+            done += n
+        metrics.count('rollouts', done)
+        if not done:
+            metrics.count('rounds_without_rollouts')
+        mean = np.where(count > 0, total / np.maximum(count, 1), -np.inf)
+        return cands[int(np.argmax(mean))]
+
+planners = {
+    'greedy': GreedyPlanner,
+    'beam': BeamPlanner,
+    'ucb': UCBPlanner,
+}
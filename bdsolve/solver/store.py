@@ -0,0 +1,122 @@
+import numpy as np
+
+class GenomeStore:
+    '''
+    Population storage as a structure of arrays: genes, score,
+    success rate (and its count), age and lineage id of every genome.
+    Arrays are allocated with spare capacity (doubling when full),
+    so the population can grow and shrink without reallocating
+    every generation. Attributes are views of the first 'len' rows.
+    '''
+
+    fields = {
+        'score': np.float32,
+        'rate_s': np.float32,
+        'rate_c': np.float32,
+        'age': np.int32,
+        'lineage': np.int64,
+    }
+
+    def __init__(self, gene_count, size=0, capacity=None):
+        self.gene_count = gene_count
+        self.size = 0
+        self.next_lineage = 0
+        self.capacity = 0
+        self.reserve(max(size, capacity or 0, 1))
+        self.resize(size)
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, capacity):
+        '''
+        Ensure space for 'capacity' genomes.
+        '''
+        if capacity <= self.capacity:
+            return
+        genes = np.zeros((capacity, self.gene_count), dtype=np.float32)
+        data = {
+            name: np.zeros(capacity, dtype=dtype)
+            for name, dtype in self.fields.items()
+        }
+        if self.capacity:
+            genes[:self.size] = self._genes[:self.size]
+            for name in self.fields:
+                data[name][:self.size] = self._data[name][:self.size]
+        self._genes, self._data = genes, data
+        self.capacity = capacity
+
+    def resize(self, size):
+        '''
+        Change the number of genomes. New genomes are zeroed,
+        with new lineage ids.
+        '''
+        if size > self.capacity:
+            self.reserve(max(size, 2*self.capacity))
+        if size > self.size:
+            self._genes[self.size:size] = 0
+            for name in self.fields:
+                self._data[name][self.size:size] = 0
+            self._data['lineage'][self.size:size] = self.new_lineages(size-self.size)
+        self.size = size
+
+    def new_lineages(self, n):
+        '''
+        'n' unused lineage ids.
+        '''
+        ids = np.arange(self.next_lineage, self.next_lineage+n)
+        self.next_lineage += n
+        return ids
+
+    def append(self, genes):
+        '''
+        Add genomes with the given genes (array of shape (n, genes)).
+        Returns their indices.
+        '''
+        n = self.size
+        self.resize(n + len(genes))
+        self._genes[n:self.size] = genes
+        return np.arange(n, self.size)
+
+    def remove(self, idx):
+        '''
+        Remove the genomes at indices 'idx', keeping the order of the rest.
+        '''
+        keep = np.ones(self.size, dtype=bool)
+        keep[idx] = False
+        n = int(keep.sum())
+        self._genes[:n] = self._genes[:self.size][keep]
+        for name in self.fields:
+            self._data[name][:n] = self._data[name][:self.size][keep]
+        self.size = n
+
+    @property
+    def genes(self):
+        return self._genes[:self.size]
+
+    @property
+    def score(self):
+        return self._data['score'][:self.size]
+
+    @property
+    def rate_s(self):
+        return self._data['rate_s'][:self.size]
+
+    @property
+    def rate_c(self):
+        return self._data['rate_c'][:self.size]
+
+    @property
+    def age(self):
+        return self._data['age'][:self.size]
+
+    @property
+    def lineage(self):
+        return self._data['lineage'][:self.size]
+
+    @property
+    def nbytes(self):
+        '''
+        Memory allocated for the arrays, in bytes.
+        '''
+        return self._genes.nbytes + sum(a.nbytes for a in self._data.values())
@@ -0,0 +1,272 @@
+import os, json, time, numpy as np
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from bdsolve.game.features import stats_cache
+from bdsolve.game.pieces import PieceSequence, random_indices
+from bdsolve.metrics import metrics
+from bdsolve.replay import Recorder, ReplayWriter
+from bdsolve.solver.genetic import Player
+from bdsolve.solver.planners import GreedyPlanner
+
+def play_game(genome, seed, **options):
+    '''
+    Play a full game with a fixed genome, drawing pieces from
+    a generator seeded with 'seed', which also seeds the lookahead
+    of the planner. Other arguments (planner, network, geometry)
+    are passed to 'Player'.
+    Returns the final score.
+    '''
+    return Player(
+        genome, np.random.default_rng(seed), seed=seed, **options).play_game()
+
+def play_sequences(genome, indices, seeds, **options):
+    '''
+    Play a game with a fixed genome on each of the given piece
+    sequences (see 'Trainer.sequences'), continuing past their end
+    with a generator seeded with the corresponding seed
+    (which also seeds the lookahead of the planner).
+    Other arguments are passed to 'Player'.
+    Greedy games are played in lockstep (see 'Player.play_games').
+    Board statistics are cached across games and genomes
+    (see 'features.stats_cache'), as the shared sequences
+    lead to the same boards.
+    Returns the mean score.
+    '''
+    p = Player(genome, cache=stats_cache, **options)
+    sequences = [
+        PieceSequence(np.random.default_rng(seed), indices=idx)
+        for idx, seed in zip(indices, seeds)
+    ]
+    if isinstance(p.planner, GreedyPlanner):
+        return np.mean(p.play_games(sequences))
+    scores = []
+    for seq, seed in zip(sequences, seeds):
+        p = Player(genome, seed=seed, cache=stats_cache, **options)
+        p.pieces = seq
+        scores.append(p.play_game())
+    return np.mean(scores)
+
+def collect(play, record, *args):
+    '''
+    Call game function 'play', returning its score,
+    the metrics collected meanwhile (see 'Metrics.take')
+    and, if 'record' is set, the moves played (see 'Recorder.take').
+    '''
+    if not record:
+        return play(*args), metrics.take(), None
+    rec = Recorder()
+    score = play(*args, recorder=rec)
+    return score, metrics.take(), rec.take()
+
+class Trainer:
+    '''
+    Headless training engine.
+
+    Every generation, each genome of the population plays a full game
+    (decoded into 'network', with moves chosen by 'planner',
+    on boards of size 's' with block size 'bs')
+    in one of 'workers' processes,
+    drawing pieces from its own generator, seeded by a SeedSequence
+    spawned from 'seed' and the generation.
+    If 'sequences' is nonzero, every genome instead plays the same
+    'sequences' piece sequences (common random numbers), scored by
+    the mean, for a less noisy comparison of the genomes.
+    The scores are collected into the population scores
+    before advancing to the next generation.
+    Every generation writes a record to the global metrics
+    (see 'bdsolve.metrics').
+    If 'replay' is given, every move played is appended to the
+    replay log at that path (see 'bdsolve.replay'), games numbered
+    per genome and generation.
+
+    The training state can be saved to and resumed from a checkpoint,
+    continuing identically (including the state of the generator
+    used by the GA operators, seeded from 'seed'). Planners hold
+    no state, their lookahead being seeded by the game seeds,
+    so this holds for any planner without a time budget. With a
+    budget, the number of rollouts depends on wall-clock time, so
+    neither resumed nor parallel runs reproduce a run exactly.
+    '''
+
+    sequence_rounds = 256
+
+    def __init__(self, pop_count=100, workers=None, seed=None, planner=None,
+                 network=None, sequences=0, s=9, bs=3, replay=None):
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.options = {
+            'planner': planner, 'network': network, 's': s, 'bs': bs}
+        self.p = Player(pop_count=pop_count, seed=self.seed, **self.options)
+        self.sequences = sequences
+        self.g = self.p.g
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = None
+        self.log = ReplayWriter(replay, s, bs) if replay else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        '''
+        Shut down the worker processes, if any,
+        and close the replay log.
+        '''
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def seeds(self):
+        '''
+        Game seeds (SeedSequence) of all genomes in the current generation.
+        '''
+        return np.random.SeedSequence(
+            [self.seed, self.g.gen_num]).spawn(self.g.pop_count)
+
+    def piece_sequences(self):
+        '''
+        Piece sequences shared by all genomes in the current generation,
+        as indices into 'all_pieces' (uint8 array of shape
+        (sequences, sequence_rounds, 3)), and the seeds continuing them.
+        '''
+        ss = np.random.SeedSequence([self.seed, self.g.gen_num])
+        indices = random_indices(
+            np.random.default_rng(ss), self.sequences*self.sequence_rounds)
+        return (
+            indices.reshape(self.sequences, self.sequence_rounds, 3),
+            ss.spawn(self.sequences))
+
+    def evaluate(self):
+        '''
+        Play a game with every genome, storing the scores.
+        '''
+        genomes = list(self.g.population)
+        if self.sequences:
+            indices, seeds = self.piece_sequences()
+            play = partial(
+                play_sequences, indices=indices, seeds=seeds, **self.options)
+            args = [genomes]
+        else:
+            play = partial(play_game, **self.options)
+            args = [genomes, self.seeds()]
+        play = partial(collect, play, self.log is not None)
+        if self.workers > 1:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers)
+            res = self.pool.map(
+                play, *args,
+                chunksize=max(1, len(genomes) // (4*self.workers)))
+        else:
+            res = map(play, *args)
+        scores = []
+        for i, (score, data, records) in enumerate(res):
+            scores.append(score)
+            metrics.merge(data)
+            if records is not None:
+                records['gen'] = self.g.gen_num
+                records['genome'] = i
+                self.log.write(records)
+        self.g.pop_score[:] = scores
+
+    def step(self):
+        '''
+        Train for one generation.
+        '''
+        t = time.perf_counter()
+        self.evaluate()
+        with metrics.timer('ga'):
+            self.p.end_generation()
+        metrics.flush(
+            gen=self.g.gen_num,
+            avg_score=float(self.p.avg_score),
+            hi_score=self.p.hi_score,
+            time_generation=round(time.perf_counter() - t, 4))
+
+    def save(self, path):
+        '''
+        Write a checkpoint of the training state to 'path' (.npz).
+        The file is replaced atomically.
+        '''
+        g, p = self.g, self.p
+        tmp = f'{path}.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(
+                f,
+                population=g.population,
+                pop_score=g.pop_score,
+                pop_success_rate_s=g.pop_success_rate_s,
+                pop_success_rate_c=g.pop_success_rate_c,
+                age=g.store.age,
+                lineage=g.store.lineage,
+                next_lineage=g.store.next_lineage,
+                total_success_rate=np.array(g.total_success_rate),
+                rates=np.array([g.crossover_rate, g.mutation_rate]),
+                operators=np.array([
+                    g.parent_count, g.mutation_genes, g.mutation_offset]),
+                gen_num=g.gen_num,
+                avg_scores=np.array(p.avg_scores, dtype=float),
+                scores=np.array([p.avg_score, p.hi_score], dtype=float),
+                seed=str(self.seed),
+                rng=json.dumps(g.rng.bit_generator.state))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, workers=None, **kwargs):
+        '''
+        Resume training from a checkpoint written by 'save'
+        (with the same network layout). Other arguments
+        are passed to the constructor.
+        '''
+        with np.load(path) as f:
+            t = cls(len(f['population']), workers, int(f['seed']), **kwargs)
+            g, p = t.g, t.p
+            g.population[:] = f['population']
+            g.pop_score[:] = f['pop_score']
+            g.pop_success_rate_s[:] = f['pop_success_rate_s']
+            g.pop_success_rate_c[:] = f['pop_success_rate_c']
+            g.store.age[:] = f['age']
+            g.store.lineage[:] = f['lineage']
+            g.store.next_lineage = int(f['next_lineage'])
+            g.total_success_rate = f['total_success_rate'].tolist()
+            g.crossover_rate, g.mutation_rate = f['rates'].tolist()
+            parent_count, mutation_genes, g.mutation_offset = \
+                f['operators'].tolist()
+            g.parent_count = int(parent_count)
+            g.mutation_genes = int(mutation_genes)
+            g.gen_num = int(f['gen_num'])
+            g.pop_num = 0
+            p.avg_scores = list(f['avg_scores'])
+            p.avg_score, p.hi_score = f['scores']
+            p.hi_score = int(p.hi_score)
+            if g.gen_num:
+                p.best_rate_genome = \
+                    g.population[np.argmax(g.pop_success_rate_s)]
+                p.best_score_genome = \
+                    g.population[np.argmax(g.pop_score)]
+            g.rng.bit_generator.state = json.loads(str(f['rng']))
+        return t
+
+    def run(self, generations, interval=0, report=print,
+            checkpoint=None, checkpoint_interval=1):
+        '''
+        Train for a number of generations.
+        Every 'interval' generations (if nonzero), report progress.
+        Every 'checkpoint_interval' generations and at the end,
+        save a checkpoint to path 'checkpoint' (if given).
+        '''
+        t = time.perf_counter()
+        for i in range(1, generations+1):
+            self.step()
+            if checkpoint and (
+                i == generations or not i % checkpoint_interval):
+                self.save(checkpoint)
+            if interval and not i % interval:
+                dt = time.perf_counter() - t
+                report(
+                    f'gen {self.g.gen_num}: avg score {self.p.avg_score}, '
+                    f'hi score {self.p.hi_score}, {dt/interval:.2f}s/gen')
+                t = time.perf_counter()
@@ -1,26 +1,59 @@
 import numpy as np, tkinter.ttk as ttk
 
-def ndarray_image(arr):
-    y, x = arr.shape
-    data = f'P5 {x} {y} 1 '.encode() + arr.astype(np.uint8).tobytes()
-    return ttk.tkinter.PhotoImage(width=x, height=y, data=data, format='PPM')
-
 class ArrayView:
+    '''
+    Draws a 2D array, or a stack of them side by side (in rows of
+    'cols', 'gap' pixels apart), as one canvas rectangle of size 'zoom'
+    per element, white if nonzero.
+    Updates only reconfigure the elements that changed.
+    '''
 
-    def __init__(self, master, arr, zoom):
-        self.array = arr
+    colors = ('black', 'white')
+
+    def __init__(self, master, arr, zoom, cols=None, gap=None):
         self.zoom = zoom
-        self.canvas = ttk.tkinter.Canvas(
-            master, bg='#272822',
-            width=arr.shape[1]*zoom,
-            height=arr.shape[0]*zoom)
-        self.img = ndarray_image(arr).zoom(zoom)
-        self.cvimg = self.canvas.create_image(
-            0, 0, anchor='nw', image=self.img)
+        self.cols = cols
+        self.gap = zoom // 2 if gap is None else gap
+        self.canvas = ttk.tkinter.Canvas(master, bg='#272822')
+        self.draw(arr)
+
+    def draw(self, arr):
+        '''
+        Create the rectangles of all elements.
+        '''
+        self.array = arr
+        self.shown = arr.copy()
+        boards = arr.reshape(-1, *arr.shape[-2:])
+        n, y, x = boards.shape
+        cols = min(self.cols or n, n)
+        rows = -(-n // cols)
+        z, gap = self.zoom, self.gap
+        self.canvas.delete('all')
+        self.canvas.config(
+            width=cols*x*z + (cols-1)*gap,
+            height=rows*y*z + (rows-1)*gap)
+        self.rects = np.empty(boards.shape, dtype=int)
+        for k, i, j in np.ndindex(boards.shape):
+            x0 = (k % cols)*(x*z + gap) + j*z
+            y0 = (k // cols)*(y*z + gap) + i*z
+            self.rects[k, i, j] = self.canvas.create_rectangle(
+                x0, y0, x0+z, y0+z, width=0,
+                fill=self.colors[boards[k, i, j] != 0])
 
-    def update(self):
-        self.img = ndarray_image(self.array).zoom(self.zoom)
-        self.canvas.itemconfig(self.cvimg, image=self.img)
+    def update(self, arr=None):
+        '''
+        Redraw the elements that changed since they were last drawn.
+        '''
+        if arr is not None:
+            self.array = arr
+        if self.array.shape != self.shown.shape:
+            self.draw(self.array)
+            return
+        vals = self.array.ravel()
+        for i in np.flatnonzero(vals != self.shown.ravel()):
+            self.canvas.itemconfig(
+                self.rects.flat[i], fill=self.colors[vals[i] != 0])
+        self.shown[...] = self.array
 
 def default_style(master):
     style = ttk.Style(master)
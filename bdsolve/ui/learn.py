@@ -1,11 +1,75 @@
-import tkinter.ttk as ttk
+import time, queue, threading, tkinter.ttk as ttk
 from bdsolve.solver.genetic import Player
 from bdsolve.ui.common import ArrayView, default_style
 
+class LearnWorker(threading.Thread):
+    '''
+    Trains a player in the background: while 'running' is set, plays
+    rounds ('Player.learn'), waiting 'delay' seconds between them, and
+    publishes a snapshot of the board and statistics after each round.
+    Only the newest 'maxsize' snapshots are queued, older ones are dropped.
+    '''
+
+    def __init__(self, player, delay=0, maxsize=2):
+        super().__init__(daemon=True)
+        self.p = player
+        self.delay = delay
+        self.running = threading.Event()
+        self.queue = queue.Queue(maxsize)
+
+    def snapshot(self):
+        p, g = self.p, self.p.g
+        return {
+            'board': p.board.board.copy(),
+            'score': p.score,
+            'avg_score': p.avg_score,
+            'hi_score': p.hi_score,
+            'pop_num': g.pop_num,
+            'pop_count': g.pop_count,
+            'gen_num': g.gen_num,
+        }
+
+    def publish(self):
+        snap = self.snapshot()
+        while True:
+            try:
+                self.queue.put_nowait(snap)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def latest(self):
+        '''
+        The newest published snapshot (dropping older ones), or None.
+        '''
+        snap = None
+        while True:
+            try:
+                snap = self.queue.get_nowait()
+            except queue.Empty:
+                return snap
+
+    def run(self):
+        while True:
+            self.running.wait()
+            self.p.learn()
+            self.publish()
+            if self.delay:
+                time.sleep(self.delay)
+
 class LearnUI:
+    '''
+    Learning GUI. Training runs in a 'LearnWorker' thread,
+    the view is refreshed from its snapshots 'fps' times per second.
+    '''
 
-    def __init__(self):
+    def __init__(self, fps=30):
         self.p = Player()
+        self.w = LearnWorker(self.p)
+        self.frame_ms = 1000 // fps
 
         self.t = ttk.tkinter.Tk()
         self.t.title('bdsolve - Learning GUI')
@@ -17,8 +81,7 @@ class LearnUI:
         self.s = default_style(self.t)
         self.vars = [
             ttk.tkinter.StringVar(self.t) for _ in range(5)]
-        self.ivars = [
-            ttk.tkinter.IntVar(self.t) for _ in range(2)]
+        self.ivars = [ttk.tkinter.IntVar(self.t)]
 
         self.f1 = ttk.Frame(
             self.t, borderwidth=6, relief='ridge',
@@ -38,19 +101,19 @@ class LearnUI:
         self.b1 = ttk.Button(
             self.f2_1, text='Learn',
             command=lambda: [
-                self.ivars[0].set(1),
-                self.run()
+                self.set_delay(),
+                self.w.running.set()
             ])
         self.b1.pack()
         self.b2 = ttk.Button(
             self.f2_1, text='Stop',
-            command=lambda: [
-                self.ivars[0].set(0)
-            ])
+            command=self.w.running.clear)
         self.b2.pack()
         ttk.Separator(self.f2_1, orient='horizontal').pack()
         self.sb = ttk.Spinbox(
-            self.f2_1, from_=10, to=1010, increment=100, width=5)
+            self.f2_1, from_=0, to=1000, increment=100, width=5,
+            command=self.set_delay)
+        self.sb.bind('<Return>', lambda _: self.set_delay())
         self.sb.pack()
         self.sb.set(110)
         self.f2_2 = ttk.Labelframe(self.f2, padding='0.1i', text='Statistics')
@@ -66,23 +129,37 @@ class LearnUI:
         self.l5 = ttk.Label(self.f2_2, textvariable=self.vars[4])
         self.l5.pack()
 
-        self.aw = ArrayView(self.f1, self.p.board.board, 40)
+        self.aw = ArrayView(self.f1, self.p.board.board.copy(), 40)
         self.aw.canvas.grid(row=0, column=0, sticky='')
         self.pr = ttk.Progressbar(
             self.f1, orient='horizontal', mode='determinate',
-            maximum=self.p.g.pop_count-1, variable=self.ivars[1])
+            maximum=self.p.g.pop_count-1, variable=self.ivars[0])
         self.pr.grid(row=1, column=0, sticky='swe')
 
+        self.w.start()
+        self.t.after(self.frame_ms, self.poll)
         self.t.mainloop()
 
-    def run(self):
-        self.p.learn()
-        self.aw.update()
-        self.ivars[1].set(self.p.g.pop_num)
-        self.vars[0].set(f'Score: {self.p.score}')
-        self.vars[1].set(f'Avg score: {self.p.avg_score}')
-        self.vars[2].set(f'Hi score: {self.p.hi_score}')
-        self.vars[3].set(f'Current: {self.p.g.pop_num+1}/{self.p.g.pop_count}')
-        self.vars[4].set(f'Generation: {self.p.g.gen_num}')
-        if self.ivars[0].get():
-            self.t.after(int(self.sb.get()), self.run)
+    def set_delay(self):
+        '''
+        Pass the delay between rounds (ms) to the worker.
+        '''
+        try:
+            self.w.delay = max(0, int(self.sb.get())) / 1000
+        except ValueError:
+            pass
+
+    def poll(self):
+        '''
+        Show the newest snapshot of the worker, if any.
+        '''
+        snap = self.w.latest()
+        if snap is not None:
+            self.aw.update(snap['board'])
+            self.ivars[0].set(snap['pop_num'])
+            self.vars[0].set(f'Score: {snap["score"]}')
+            self.vars[1].set(f'Avg score: {snap["avg_score"]}')
+            self.vars[2].set(f'Hi score: {snap["hi_score"]}')
+            self.vars[3].set(f'Current: {snap["pop_num"]+1}/{snap["pop_count"]}')
+            self.vars[4].set(f'Generation: {snap["gen_num"]}')
+        self.t.after(self.frame_ms, self.poll)